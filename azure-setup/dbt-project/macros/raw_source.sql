@@ -0,0 +1,31 @@
+{#
+    Raw data loading. By default staging reads the seeds. With
+    `--vars '{raw_data_path: /path}'` the landing models bulk-load the files under
+    <raw_data_path>/<seed name>/ into Delta tables registered in Unity Catalog, and
+    staging reads those instead (run with `--exclude resource_type:seed`).
+    `raw_data_format` selects parquet (default) or csv input files.
+#}
+
+{% macro raw_source(name) -%}
+    {%- if var('raw_data_path', none) -%}
+        {{ ref(name | replace('raw_', 'landing_', 1)) }}
+    {%- else -%}
+        {{ ref(name) }}
+    {%- endif -%}
+{%- endmacro %}
+
+{% macro read_raw_files(name) -%}
+    {#- Every file of the dataset in one scan; DuckDB reads the files in parallel -#}
+    {%- set files = var('raw_data_path') ~ '/' ~ name ~ '/*.' ~ var('raw_data_format', 'parquet') -%}
+    {%- if var('raw_data_format', 'parquet') == 'csv' -%}
+        {#- Read as text and cast in the landing model, so every file gets the same typed schema -#}
+        read_csv('{{ files }}', header = true, all_varchar = true, union_by_name = true)
+    {%- else -%}
+        read_parquet('{{ files }}', union_by_name = true)
+    {%- endif -%}
+{%- endmacro %}
+
+{% macro parse_decimal(column_name, precision=18, scale=2) -%}
+    {#- The O2C extracts use a decimal comma, e.g. "663,36" -#}
+    replace({{ column_name }}::varchar, ',', '.')::decimal({{ precision }}, {{ scale }})
+{%- endmacro %}
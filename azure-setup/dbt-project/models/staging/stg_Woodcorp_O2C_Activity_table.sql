@@ -1,17 +1,17 @@
 
 with source as (
 
-    select * from {{ref('raw_Woodcorp_O2C_Activity_table')}}
+    select * from {{ raw_source('raw_Woodcorp_O2C_Activity_table') }}
 
 ),
 
 
 renamed as (
 
-    select CASE_KEY as case_key,
-            ACTIVITY_EN as activity_name,
-            EVENTTIME as time_of_event,
-            SORTING as sort_value
+    select CASE_KEY::bigint as case_key,
+            ACTIVITY_EN::varchar as activity_name,
+            EVENTTIME::timestamp as time_of_event,
+            SORTING::integer as sort_value
             from source
 
 )
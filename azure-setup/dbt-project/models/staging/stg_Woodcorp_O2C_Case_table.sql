@@ -1,36 +1,38 @@
 
 with source as (
 
-    select * from {{ref('raw_Woodcorp_O2C_Case_table')}}
+    select * from {{ raw_source('raw_Woodcorp_O2C_Case_table') }}
 
 ),
 
 
 renamed as (
 
-    select CASE_KEY,
-DELIVERY_COMPANY,
-PRODUCT_TYPE,
-FACTORY,
-ORDERED_QUANTITY,
-DELIVERED_QUANTITY,
-MIN_ORDER_TOLERANCE,
-MAX_ORDER_TOLERANCE,
-CUST_MARKET,
-CUST_ID,
-CUST_NAME,
-CUST_ADDR_CODE,
-DAYS_TO_DEL_DEADLINE,
-ORDER_TOLERANCE_MET,
-ORDER_DATE_MET,
+    -- Typed and cleaned here so the seeds and the landing tables give the same relation
+    select CASE_KEY::bigint as CASE_KEY,
+DELIVERY_COMPANY::varchar as DELIVERY_COMPANY,
+PRODUCT_TYPE::varchar as PRODUCT_TYPE,
+FACTORY::varchar as FACTORY,
+ORDERED_QUANTITY::integer as ORDERED_QUANTITY,
+DELIVERED_QUANTITY::integer as DELIVERED_QUANTITY,
+MIN_ORDER_TOLERANCE::integer as MIN_ORDER_TOLERANCE,
+MAX_ORDER_TOLERANCE::integer as MAX_ORDER_TOLERANCE,
+CUST_MARKET::varchar as CUST_MARKET,
+CUST_ID::bigint as CUST_ID,
+CUST_NAME::varchar as CUST_NAME,
+CUST_ADDR_CODE::integer as CUST_ADDR_CODE,
+DAYS_TO_DEL_DEADLINE::integer as DAYS_TO_DEL_DEADLINE,
+ORDER_TOLERANCE_MET::integer as ORDER_TOLERANCE_MET,
+ORDER_DATE_MET::integer as ORDER_DATE_MET,
 'X_CEL_O2C_CASES.SAL_ORD_POS_QUAN',
-DELIVERED_QUANTITY_UNIT,
-WAREHOUSE_TYPE,
-DELIVERED_DATE,
-PROMISED_DATE,
-CUST_COUNTRY,
-ORDER_VALUE,
-UNIT_PRICE,
+DELIVERED_QUANTITY_UNIT::varchar as DELIVERED_QUANTITY_UNIT,
+WAREHOUSE_TYPE::varchar as WAREHOUSE_TYPE,
+DELIVERED_DATE::timestamp as DELIVERED_DATE,
+PROMISED_DATE::timestamp as PROMISED_DATE,
+trim(CUST_COUNTRY::varchar) as CUST_COUNTRY,
+-- The O2C extracts use decimal commas, parsed once here instead of downstream
+{{ parse_decimal('ORDER_VALUE') }} as ORDER_VALUE,
+{{ parse_decimal('UNIT_PRICE') }} as UNIT_PRICE
 
             from source
 
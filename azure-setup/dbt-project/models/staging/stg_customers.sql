@@ -4,16 +4,16 @@ with source as (
     Normally we would select from the table here, but we are using seeds to load
     our data in this project
     #}
-    select * from {{ ref('raw_customers') }}
+    select * from {{ raw_source('raw_customers') }}
 
 ),
 
 renamed as (
 
     select
-        id as customer_id,
-        first_name,
-        last_name
+        id::bigint as customer_id,
+        first_name::varchar as first_name,
+        last_name::varchar as last_name
 
     from source
 
@@ -4,16 +4,16 @@ with source as (
     Normally we would select from the table here, but we are using seeds to load
     our data in this project
     #}
-    select * from {{ ref('raw_payments') }}
+    select * from {{ raw_source('raw_payments') }}
 
 ),
 
 renamed as (
 
     select
-        id as payment_id,
-        order_id,
-        payment_method,
+        id::bigint as payment_id,
+        order_id::bigint as order_id,
+        payment_method::varchar as payment_method,
 
         -- `amount` is currently stored in cents, so we convert it to dollars
         amount / 100 as amount
@@ -1,11 +1,21 @@
 {{ config(
     materialized='external_table',
     location=var('storage_path'),
-    plugin='unity'
+    plugin='unity',
+    mode=external_write_mode(),
+    unique_key=['case_key', 'activity_name', 'time_of_event'],
+    partition_by=['event_month'],
+    pre_hook="{{ external_merge_guard('before', 'time_of_event') }}",
+    post_hook="{{ external_merge_guard('after', 'time_of_event') }}"
 ) }}
 
 with final as (
-    select * from {{ref('stg_Woodcorp_O2C_Activity_table')}}
+    select *, strftime(time_of_event, '%Y-%m') as event_month
+    from {{ref('stg_Woodcorp_O2C_Activity_table')}}
+    {% if is_incremental_external() %}
+    -- The activity log is append-only: only pick up events from the last one written on
+    where time_of_event >= {{ external_high_water_mark('time_of_event') }}
+    {% endif %}
 )
 
 select * from final
@@ -0,0 +1,80 @@
+{#
+    Helpers for incremental `external_table` models.
+    Incremental runs are opt-in with `--vars '{external_incremental: true}'`; otherwise every run
+    rebuilds the full table as before. The existing table is always read through its Unity Catalog
+    relation (`this`), never through its storage path.
+#}
+
+{% macro external_incremental_enabled() -%}
+    {{ return(var('external_incremental', false) and not flags.FULL_REFRESH) }}
+{%- endmacro %}
+
+{% macro external_write_mode() -%}
+    {{ return('merge' if external_incremental_enabled() else 'overwrite') }}
+{%- endmacro %}
+
+{% macro external_existing_relation(relation=this) -%}
+    {{ return(adapter.get_relation(database=relation.database, schema=relation.schema, identifier=relation.identifier)) }}
+{%- endmacro %}
+
+{% macro is_incremental_external(relation=this, required_columns=[]) -%}
+    {#- True when incremental mode is on, this is not a --full-refresh and the target table exists -#}
+    {%- if not execute or not external_incremental_enabled() -%}
+        {{ return(false) }}
+    {%- endif -%}
+    {%- set existing = external_existing_relation(relation) -%}
+    {%- if existing is none -%}
+        {{ return(false) }}
+    {%- endif -%}
+    {%- set columns = adapter.get_columns_in_relation(existing) | map(attribute='name') | map('lower') | list -%}
+    {%- for column in required_columns if column | lower not in columns -%}
+        {{ exceptions.raise_compiler_error(
+            relation ~ " has no column '" ~ column ~ "' (it was written before incremental support). "
+            ~ "Rebuild it once with --full-refresh before running with external_incremental.") }}
+    {%- endfor -%}
+    {{ return(true) }}
+{%- endmacro %}
+
+{% macro external_high_water_mark(column, relation=this) -%}
+    {#-
+        Rows are re-read from the high-water mark itself (>=) and `external_lookback_hours` before it,
+        so same-timestamp and late events are picked up again; the merge on unique_key de-duplicates them.
+    -#}
+    (select max({{ column }}) - interval '{{ var('external_lookback_hours', 0) }} hours' from {{ relation }})
+{%- endmacro %}
+
+{#
+    The merge itself is done by the unity plugin (mode='merge' + unique_key). If a plugin version
+    ignores the mode and overwrites, an incremental run would leave only the re-read rows behind.
+    These hooks record the row count and the earliest `column` value before the write and fail the
+    model if the table lost rows or its earliest value moved forward, which an overwrite always does
+    once the table holds rows from before the high-water mark. `--full-refresh` rebuilds the table
+    from its sources.
+#}
+{% macro external_merge_guard(stage, column, relation=this) -%}
+    {%- if not external_incremental_enabled() -%}
+        {{ return('') }}
+    {%- endif -%}
+    {%- set before_table_name = relation.identifier ~ '__before_merge' -%}
+    {%- set before_table = 'temp.main."' ~ before_table_name ~ '"' -%}
+    {%- if stage == 'before' -%}
+        {%- if external_existing_relation(relation) is none -%}
+            {{ return('drop table if exists ' ~ before_table) }}
+        {%- endif -%}
+        {{ return('create or replace temp table ' ~ before_table ~ ' as select count(*) as row_count, min('
+                  ~ column ~ ') as first_value from ' ~ relation) }}
+    {%- endif -%}
+    {%- if execute -%}
+        {%- set recorded = run_query("select count(*) from duckdb_tables() where database_name = 'temp' and table_name = '"
+                                     ~ before_table_name ~ "'").columns[0].values()[0] -%}
+        {%- if recorded == 0 -%}
+            {#- The table didn't exist before this run -#}
+            {{ return('') }}
+        {%- endif -%}
+    {%- endif -%}
+    {{ return("select case when after.row_count < before.row_count or after.first_value > before.first_value"
+              ~ " then error('" ~ relation ~ " lost rows in an incremental run: the unity plugin did not merge."
+              ~ " Rebuild it with --full-refresh.') end"
+              ~ " from " ~ before_table ~ " as before,"
+              ~ " (select count(*) as row_count, min(" ~ column ~ ") as first_value from " ~ relation ~ ") as after") }}
+{%- endmacro %}
@@ -0,0 +1,33 @@
+{{ config(
+    materialized='external_table',
+    location=var('storage_path'),
+    plugin='unity',
+    enabled=var('raw_data_path', none) is not none
+) }}
+
+select
+    CASE_KEY::bigint as CASE_KEY,
+    DELIVERY_COMPANY::varchar as DELIVERY_COMPANY,
+    PRODUCT_TYPE::varchar as PRODUCT_TYPE,
+    FACTORY::varchar as FACTORY,
+    ORDERED_QUANTITY::integer as ORDERED_QUANTITY,
+    DELIVERED_QUANTITY::integer as DELIVERED_QUANTITY,
+    MIN_ORDER_TOLERANCE::integer as MIN_ORDER_TOLERANCE,
+    MAX_ORDER_TOLERANCE::integer as MAX_ORDER_TOLERANCE,
+    CUST_MARKET::varchar as CUST_MARKET,
+    CUST_ID::bigint as CUST_ID,
+    CUST_NAME::varchar as CUST_NAME,
+    CUST_ADDR_CODE::integer as CUST_ADDR_CODE,
+    DAYS_TO_DEL_DEADLINE::integer as DAYS_TO_DEL_DEADLINE,
+    ORDER_TOLERANCE_MET::integer as ORDER_TOLERANCE_MET,
+    ORDER_DATE_MET::integer as ORDER_DATE_MET,
+    "X_CEL_O2C_CASES.SAL_ORD_POS_QUAN"::integer as "X_CEL_O2C_CASES.SAL_ORD_POS_QUAN",
+    DELIVERED_QUANTITY_UNIT::varchar as DELIVERED_QUANTITY_UNIT,
+    WAREHOUSE_TYPE::varchar as WAREHOUSE_TYPE,
+    DELIVERED_DATE::timestamp as DELIVERED_DATE,
+    PROMISED_DATE::timestamp as PROMISED_DATE,
+    -- Kept as extracted; staging trims and parses them for both the seed and the file path
+    CUST_COUNTRY::varchar as CUST_COUNTRY,
+    ORDER_VALUE::varchar as ORDER_VALUE,
+    UNIT_PRICE::varchar as UNIT_PRICE
+from {{ read_raw_files('raw_Woodcorp_O2C_Case_table') }}
@@ -0,0 +1,13 @@
+{{ config(
+    materialized='external_table',
+    location=var('storage_path'),
+    plugin='unity',
+    enabled=var('raw_data_path', none) is not none
+) }}
+
+select
+    id::bigint as id,
+    order_id::bigint as order_id,
+    payment_method::varchar as payment_method,
+    amount::integer as amount
+from {{ read_raw_files('raw_payments') }}
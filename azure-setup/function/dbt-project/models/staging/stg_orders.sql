@@ -4,17 +4,17 @@ with source as (
     Normally we would select from the table here, but we are using seeds to load
     our data in this project
     #}
-    select * from {{ ref('raw_orders') }}
+    select * from {{ raw_source('raw_orders') }}
 
 ),
 
 renamed as (
 
     select
-        id as order_id,
-        user_id as customer_id,
-        order_date,
-        status
+        id::bigint as order_id,
+        user_id::bigint as customer_id,
+        order_date::date as order_date,
+        status::varchar as status
 
     from source
 
@@ -0,0 +1,131 @@
+"""
+Fast-start dbt jobs: one long-lived container group per job that is started again for every
+run instead of being deployed from the ARM template, plus cleanup of the `dbt-job-<timestamp>`
+groups that per-run deployments leave behind.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+
+import dbt_sharding
+
+# Tag holding the hash of the ARM template and parameters a fast-start group was deployed with
+CONFIG_HASH_TAG = "dbt-config-hash"
+# Where the dbt job container mounts the project file share (dbtProjectMountPath in dbt-job.json)
+DBT_PROJECT_MOUNT_PATH = "/dbt_project"
+# Groups created by per-run deployments: dbt-job-<unix timestamp>[-<shard index>]
+JOB_GROUP_PATTERN = re.compile(r"^dbt-job-(\d+)(?:-\d+)?$")
+
+
+def config_hash(arm_template, arm_parameters):
+    """Hash of everything the container group is deployed from. Secrets are included, but only the hash is stored."""
+    payload = json.dumps({"template": arm_template, "parameters": arm_parameters}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def selector_file_name(job_instance_name):
+    """File on the project share holding a fast-start job's `--select` for its next run (empty: everything)."""
+    return f".dbt_selector_{job_instance_name}"
+
+
+def dbt_container_state(container_group):
+    for container in container_group.containers or []:
+        if container.name == dbt_sharding.DBT_CONTAINER_NAME and container.instance_view:
+            return container.instance_view.current_state
+    return None
+
+
+class FastStartBackend(dbt_sharding.ArmDeploymentBackend):
+    """
+    Keeps a stopped container group per job name and starts it again for the next run. The group is
+    only deployed from the ARM template when it doesn't exist yet or its configuration changed
+    (sizing, token, template, ...), in which case ARM updates it in place.
+
+    The `dbtSelector` parameter isn't part of that configuration: the selection changes from run to run
+    in change-aware mode, so it is written to a file on the project share (azure.storage.fileshare.aio.ShareClient)
+    that the container reads when it starts, and the group is deployed with `dbtSelectorFile` instead.
+    """
+
+    def __init__(self, resource_client, aci_client, resource_group, arm_template, share_client):
+        super().__init__(resource_client, aci_client, resource_group, arm_template)
+        self.share_client = share_client
+        self._previous_finish_time = {}  # job name -> finish time of the run before this one
+
+    async def _get_group(self, job_instance_name):
+        try:
+            return await self.aci_client.container_groups.get(self.resource_group, job_instance_name)
+        except ResourceNotFoundError:
+            return None
+
+    async def _start(self, job_instance_name):
+        poller = await self.aci_client.container_groups.begin_start(self.resource_group, job_instance_name)
+        await poller.result()
+
+    async def _write_selector(self, job_instance_name, arm_parameters):
+        selector = arm_parameters.get("dbtSelector", {}).get("value", "")
+        file_name = selector_file_name(job_instance_name)
+        await self.share_client.get_file_client(file_name).upload_file(selector.encode())
+        return {**arm_parameters, "dbtSelector": {"value": ""},
+                "dbtSelectorFile": {"value": f"{DBT_PROJECT_MOUNT_PATH}/{file_name}"}}
+
+    async def deploy(self, job_instance_name, arm_parameters):
+        container_group = await self._get_group(job_instance_name)
+        state = dbt_container_state(container_group) if container_group else None
+        if state and state.state in ("Running", "Waiting"):
+            raise Exception(f"Container group '{job_instance_name}' is still running the previous dbt job.")
+        arm_parameters = await self._write_selector(job_instance_name, arm_parameters)
+        digest = config_hash(self.arm_template, arm_parameters)
+        previous_finish_time = self._previous_finish_time[job_instance_name] = state.finish_time if state else None
+
+        if container_group is not None and (container_group.tags or {}).get(CONFIG_HASH_TAG) == digest:
+            logging.info(f"Starting the existing container group '{job_instance_name}'.")
+            try:
+                await self._start(job_instance_name)
+                return "started"
+            except HttpResponseError as e:
+                logging.warning(f"Could not start '{job_instance_name}', deploying it again: {e}")
+
+        logging.info(f"Deploying container group '{job_instance_name}' (new, or its configuration changed).")
+        await super().deploy(job_instance_name, {**arm_parameters, "tags": {"value": {CONFIG_HASH_TAG: digest}}})
+        if container_group is not None:
+            # A deployment that changes nothing in the group leaves its container stopped
+            state = dbt_container_state(await self._get_group(job_instance_name))
+            if state and state.state == "Terminated" and state.finish_time == previous_finish_time:
+                await self._start(job_instance_name)
+        return "deployed"
+
+    async def get_exit_code(self, job_instance_name):
+        """Returns the exit code of this run, ignoring the previous run's until the container restarted."""
+        state = dbt_container_state(await self.aci_client.container_groups.get(self.resource_group, job_instance_name))
+        if state and state.state == "Terminated" and state.finish_time != self._previous_finish_time.get(job_instance_name):
+            return state.exit_code
+        return None
+
+
+async def cleanup_job_groups(aci_client, resource_group, retention_hours=24, now=None):
+    """
+    Deletes the dbt-job-<timestamp> container groups of runs older than `retention_hours` (far beyond
+    the job timeout, so their containers have exited). Deletion isn't awaited, ARM finishes it
+    server-side. Returns the names of the deleted groups.
+    """
+    now = now or time.time()
+    names = []
+    async for container_group in aci_client.container_groups.list_by_resource_group(resource_group):
+        match = JOB_GROUP_PATTERN.match(container_group.name)
+        if match and now - int(match.group(1)) > retention_hours * 3600:
+            names.append(container_group.name)
+
+    results = await asyncio.gather(*(
+        aci_client.container_groups.begin_delete(resource_group, name) for name in names), return_exceptions=True)
+    deleted = []
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            logging.warning(f"Could not delete container group '{name}': {result}")
+        else:
+            deleted.append(name)
+    return deleted
@@ -0,0 +1,188 @@
+"""
+Splits a dbt project into independent groups of nodes using its manifest, so each group
+can run as its own dbt job container in parallel with the others.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import math
+import re
+import time
+
+# Node types that run as part of `dbt build`; sources are inputs, not work
+BUILDABLE_RESOURCE_TYPES = {"model", "seed", "snapshot", "test"}
+# Matches containerName in dbt-job.bicep
+DBT_CONTAINER_NAME = "dbt-runner"
+# dbt's progress lines, e.g. "1 of 24 START sql external_table model raw.landing_orders ..."
+NODE_START_PATTERN = re.compile(r"\b\d+ of \d+ START\b")
+
+
+def load_manifest(manifest_path):
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def split_into_groups(manifest, project_name=None):
+    """
+    Returns the connected components of the project's DAG as lists of node dicts.
+    Two nodes share a group when one depends on the other, directly or through other nodes.
+    Tests are kept in the group of the nodes they test.
+    """
+    nodes = {
+        unique_id: node for unique_id, node in manifest["nodes"].items()
+        if node["resource_type"] in BUILDABLE_RESOURCE_TYPES
+        and (project_name is None or node.get("package_name") == project_name)
+    }
+
+    # Union-find over dependency edges
+    parent = {unique_id: unique_id for unique_id in nodes}
+
+    def find(unique_id):
+        while parent[unique_id] != unique_id:
+            parent[unique_id] = parent[parent[unique_id]]
+            unique_id = parent[unique_id]
+        return unique_id
+
+    for unique_id, node in nodes.items():
+        for dependency in node.get("depends_on", {}).get("nodes", []):
+            if dependency in nodes:
+                parent[find(dependency)] = find(unique_id)
+
+    groups = {}
+    for unique_id, node in nodes.items():
+        groups.setdefault(find(unique_id), []).append(node)
+    # Largest groups first so they are deployed first
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def merge_groups(groups, max_groups):
+    """Bin-packs groups into at most `max_groups` buckets, balancing node counts."""
+    if len(groups) <= max_groups:
+        return groups
+    buckets = [[] for _ in range(max_groups)]
+    for group in sorted(groups, key=len, reverse=True):
+        min(buckets, key=len).extend(group)
+    return [bucket for bucket in buckets if bucket]
+
+
+def group_selector(group):
+    """dbt --select value for a group; `dbt build` picks up the tests of the selected nodes."""
+    return " ".join(sorted(node["name"] for node in group if node["resource_type"] != "test"))
+
+
+def size_group(group, models_per_core, max_cpu_cores, min_cpu_cores=1, memory_gb_per_core=1):
+    """Returns (cpu_cores, memory_gb) for a group, scaling with the number of models and seeds."""
+    work_nodes = sum(1 for node in group if node["resource_type"] != "test")
+    cpu_cores = max(min_cpu_cores, min(max_cpu_cores, math.ceil(work_nodes / models_per_core)))
+    return cpu_cores, cpu_cores * memory_gb_per_core
+
+
+def plan_jobs(manifest, max_parallel_jobs, models_per_core, max_cpu_cores, min_cpu_cores=1, memory_gb_per_core=1):
+    """Returns [{"selector", "cpu_cores", "memory_gb", "node_count"}], one entry per dbt job."""
+    groups = merge_groups(split_into_groups(manifest, manifest.get("metadata", {}).get("project_name")),
+                          max_parallel_jobs)
+    jobs = []
+    for group in groups:
+        cpu_cores, memory_gb = size_group(group, models_per_core, max_cpu_cores, min_cpu_cores, memory_gb_per_core)
+        jobs.append({"selector": group_selector(group), "cpu_cores": cpu_cores,
+                     "memory_gb": memory_gb, "node_count": len(group)})
+    return jobs
+
+
+def parse_log_timestamp(value):
+    """Parses an ACI log timestamp (RFC 3339, nanosecond precision) into an aware datetime."""
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))  # fromisoformat stops at microseconds
+    return datetime.datetime.fromisoformat(value)
+
+
+def first_node_started_at(log_content):
+    """When dbt started its first model (or seed), from container logs fetched with timestamps; None if it didn't."""
+    for line in (log_content or "").splitlines():
+        timestamp, _, message = line.partition(" ")
+        if NODE_START_PATTERN.search(message):
+            try:
+                return parse_log_timestamp(timestamp)
+            except ValueError:
+                return None
+    return None
+
+
+class ArmDeploymentBackend:
+    """Deploys dbt job container groups from the ARM template and polls them until the container exits."""
+
+    def __init__(self, resource_client, aci_client, resource_group, arm_template):
+        self.resource_client = resource_client
+        self.aci_client = aci_client
+        self.resource_group = resource_group
+        self.arm_template = arm_template
+
+    async def deploy(self, job_instance_name, arm_parameters):
+        deployment_name = f"dbt-job-deploy-{job_instance_name}"
+        deployment_properties = {'mode': 'Incremental', 'template': self.arm_template, 'parameters': arm_parameters}
+        poller = await self.resource_client.deployments.begin_create_or_update(
+            self.resource_group, deployment_name, {'properties': deployment_properties})
+        final_deployment_state = await poller.result()
+        if final_deployment_state.properties.provisioning_state != "Succeeded":
+            raise Exception(f"Deployment '{deployment_name}' failed: {final_deployment_state.properties.error}")
+        return "deployed"
+
+    async def get_exit_code(self, job_instance_name):
+        """Returns the dbt container's exit code, or None while it is still running."""
+        container_group = await self.aci_client.container_groups.get(self.resource_group, job_instance_name)
+        for container in container_group.containers or []:
+            state = container.instance_view.current_state if container.instance_view else None
+            if state and state.state == "Terminated":
+                return state.exit_code
+        return None
+
+    async def first_node_started_at(self, job_instance_name):
+        logs = await self.aci_client.containers.list_logs(
+            self.resource_group, job_instance_name, DBT_CONTAINER_NAME, timestamps=True)
+        return first_node_started_at(logs.content)
+
+
+async def time_to_first_model(backend, job_instance_name, submitted_at):
+    """Seconds from submitting the job until dbt started its first model, or None if unknown."""
+    try:
+        started_at = await backend.first_node_started_at(job_instance_name)
+    except Exception as e:
+        logging.warning(f"Could not read the logs of dbt job '{job_instance_name}': {e}")
+        return None
+    return round((started_at - submitted_at).total_seconds(), 3) if started_at else None
+
+
+async def run_job(backend, job_instance_name, arm_parameters, poll_interval_seconds, timeout_seconds):
+    """Deploys (or restarts) one dbt job and waits for its container to exit. Returns a result dict."""
+    started = time.perf_counter()
+    submitted_at = datetime.datetime.now(datetime.timezone.utc)
+    result = {"job": job_instance_name, "succeeded": False, "exit_code": None}
+    try:
+        result["start_mode"] = await backend.deploy(job_instance_name, arm_parameters)
+        result["deployed_seconds"] = round(time.perf_counter() - started, 3)
+        while time.perf_counter() - started < timeout_seconds:
+            exit_code = await backend.get_exit_code(job_instance_name)
+            if exit_code is not None:
+                result["exit_code"] = exit_code
+                result["succeeded"] = exit_code == 0
+                result["time_to_first_model_seconds"] = await time_to_first_model(
+                    backend, job_instance_name, submitted_at)
+                break
+            await asyncio.sleep(poll_interval_seconds)
+        else:
+            result["error"] = f"Timed out after {timeout_seconds}s waiting for the dbt container to exit."
+    except Exception as e:
+        logging.error(f"dbt job '{job_instance_name}' failed: {e}")
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_jobs(backend, jobs, poll_interval_seconds=15, timeout_seconds=540):
+    """
+    Runs [(job_instance_name, arm_parameters)] in parallel and waits for all of them.
+    Returns (all_succeeded, results); the run only counts as successful once every job exited with 0.
+    """
+    results = await asyncio.gather(*(
+        run_job(backend, name, parameters, poll_interval_seconds, timeout_seconds) for name, parameters in jobs))
+    return all(result["succeeded"] for result in results), results
@@ -0,0 +1,182 @@
+"""
+Maintenance for the Delta tables written by the dbt external_table models: bin-packs small
+files into target-size files, writes a Parquet checkpoint every N commits and vacuums files
+no longer referenced by the table once they are older than the retention window.
+
+Tables are found through Unity Catalog (their storage_location) or, for local testing, by
+walking a directory for `_delta_log` folders:
+
+    python delta_maintenance.py ../../docker-setup/docker_files/data --vacuum-retention-hours 0
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from deltalake import DeltaTable
+from deltalake.fs import DeltaStorageHandler
+from pyarrow import fs
+
+UC_API_PATH = "/api/2.1/unity-catalog"
+
+
+def discover_local_tables(root):
+    """Directories under `root` that contain a `_delta_log` folder."""
+    return sorted(str(log_dir.parent) for log_dir in Path(root).rglob("_delta_log") if log_dir.is_dir())
+
+
+async def _uc_list(session, url, key, params):
+    """Follows next_page_token through a UC list endpoint."""
+    items, params = [], dict(params)
+    while True:
+        async with session.get(url, params=params) as response:
+            response.raise_for_status()
+            page = await response.json()
+        items.extend(page.get(key) or [])
+        if not page.get("next_page_token"):
+            return items
+        params["page_token"] = page["next_page_token"]
+
+
+async def discover_uc_tables(uc_server_url, uc_token, catalogs=None):
+    """Storage locations of the Delta tables registered in Unity Catalog."""
+    import aiohttp
+
+    base_url = f"{uc_server_url}{UC_API_PATH}"
+    headers = {"Authorization": f"Bearer {uc_token}"}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        if not catalogs:
+            catalogs = [c["name"] for c in await _uc_list(session, f"{base_url}/catalogs", "catalogs", {})]
+        schemas = []
+        for catalog in catalogs:
+            schemas += await _uc_list(session, f"{base_url}/schemas", "schemas", {"catalog_name": catalog})
+        table_lists = await asyncio.gather(*(
+            _uc_list(session, f"{base_url}/tables", "tables",
+                     {"catalog_name": schema["catalog_name"], "schema_name": schema["name"]})
+            for schema in schemas))
+    return sorted(
+        table["storage_location"] for tables in table_lists for table in tables
+        if table.get("storage_location") and (table.get("data_source_format") or "DELTA").upper() == "DELTA")
+
+
+def stored_data_files(table_fs):
+    """Paths, relative to the table root, of the data files physically present in the table directory."""
+    return {info.path for info in table_fs.get_file_info(fs.FileSelector("", recursive=True))
+            if info.type == fs.FileType.File and not info.path.startswith("_delta_log/")}
+
+
+def storage_stats(table_fs):
+    """Data files and commits physically present in the table directory."""
+    stats = {"stored_files": 0, "stored_bytes": 0, "log_commits": 0}
+    for info in table_fs.get_file_info(fs.FileSelector("", recursive=True)):
+        if info.type != fs.FileType.File:
+            continue
+        if info.path.startswith("_delta_log/"):
+            stats["log_commits"] += info.path.endswith(".json")
+        else:
+            stats["stored_files"] += 1
+            stats["stored_bytes"] += info.size
+    return stats
+
+
+def snapshot_stats(dt):
+    """Files and bytes referenced by the current version of the table."""
+    sizes = dt.get_add_actions(flatten=True).column("size_bytes").to_pylist()
+    return {"version": dt.version(), "active_files": len(sizes), "active_bytes": sum(sizes)}
+
+
+def last_checkpoint_version(table_fs):
+    try:
+        with table_fs.open_input_stream("_delta_log/_last_checkpoint") as stream:
+            return json.loads(stream.read())["version"]
+    except FileNotFoundError:
+        return None
+
+
+def maintain_table(table_uri, storage_options=None, target_file_size=134217728, checkpoint_interval=10,
+                   vacuum_retention_hours=168, vacuum_dry_run=False):
+    """Compacts, checkpoints and vacuums one table. Returns a report dict with before/after stats."""
+    started = time.perf_counter()
+    dt = DeltaTable(table_uri, storage_options=storage_options)
+    table_fs = fs.PyFileSystem(DeltaStorageHandler(dt.table_uri, options=storage_options))
+    report = {"table": table_uri, "before": {**snapshot_stats(dt), **storage_stats(table_fs)}}
+
+    # Bin-pack small files; partitions with a single file or already at target size are skipped
+    metrics = dt.optimize.compact(target_size=target_file_size)
+    report["compaction"] = {"files_removed": metrics["numFilesRemoved"], "files_added": metrics["numFilesAdded"]}
+
+    # Readers replay every JSON commit since the last checkpoint, so keep that tail short
+    checkpointed = last_checkpoint_version(table_fs)
+    if dt.version() - (checkpointed if checkpointed is not None else -1) >= checkpoint_interval:
+        dt.create_checkpoint()
+        # Drops commits older than the table's delta.logRetentionDuration now that a checkpoint covers them
+        dt.cleanup_metadata()
+        report["checkpoint_version"] = dt.version()
+
+    # Only files removed from the table longer than the retention window ago, so running readers are safe.
+    # A real vacuum writes VACUUM START/END commits even when it deletes nothing, so list the candidates first.
+    vacuum_options = {"retention_hours": vacuum_retention_hours, "enforce_retention_duration": vacuum_retention_hours >= 168}
+    candidates = dt.vacuum(dry_run=True, **vacuum_options)
+    # The dry run lists every expired tombstone, including files an earlier vacuum already deleted
+    stored = stored_data_files(table_fs) if candidates else set()
+    table_prefix = dt.table_uri.rstrip("/") + "/"
+    candidates = [path for path in candidates if path.removeprefix(table_prefix) in stored]
+    report["vacuum"] = {"candidates": len(candidates), "files_deleted": 0, "dry_run": vacuum_dry_run}
+    vacuumed = bool(candidates) and not vacuum_dry_run
+    if vacuumed:
+        dt.vacuum(dry_run=False, **vacuum_options)
+
+    dt = DeltaTable(table_uri, storage_options=storage_options)
+    report["after"] = {**snapshot_stats(dt), **storage_stats(table_fs)}
+    if vacuumed:
+        # What actually left storage, rather than the list vacuum returns
+        report["vacuum"]["files_deleted"] = len(stored) - report["after"]["stored_files"]
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+async def maintain_tables(table_uris, max_concurrency=4, **options):
+    """Maintains tables in worker threads, at most `max_concurrency` at a time; a failing table does not stop the rest."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(table_uri):
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(maintain_table, table_uri, **options)
+            except Exception as e:
+                logging.error(f"Delta maintenance failed for '{table_uri}': {e}")
+                return {"table": table_uri, "error": str(e)}
+
+    return await asyncio.gather(*(run(table_uri) for table_uri in table_uris))
+
+
+def summarize(reports):
+    summary = {"tables": len(reports), "failed": sum(1 for r in reports if "error" in r)}
+    for stage in ("before", "after"):
+        for stat in ("active_files", "stored_files", "stored_bytes", "log_commits"):
+            summary[f"{stat}_{stage}"] = sum(r[stage][stat] for r in reports if stage in r)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", type=Path, help="Directory to search for Delta tables")
+    parser.add_argument("--target-file-size", type=int, default=134217728)
+    parser.add_argument("--checkpoint-interval", type=int, default=10)
+    parser.add_argument("--vacuum-retention-hours", type=int, default=168)
+    parser.add_argument("--dry-run", action="store_true", help="List the files vacuum would delete, without deleting")
+    parser.add_argument("--max-concurrency", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    reports = asyncio.run(maintain_tables(
+        discover_local_tables(args.root), max_concurrency=args.max_concurrency,
+        target_file_size=args.target_file_size, checkpoint_interval=args.checkpoint_interval,
+        vacuum_retention_hours=args.vacuum_retention_hours, vacuum_dry_run=args.dry_run))
+    print(json.dumps({"summary": summarize(reports), "tables": reports}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,240 @@
 import logging
 import os
 import json
+import time
+import uuid
+import asyncio
 import datetime
+from contextlib import AsyncExitStack
 from pathlib import Path
+from urllib.parse import urlparse
 import azure.functions as func
-from azure.identity import DefaultAzureCredential, ManagedIdentityCredential
-# Only need ACI and Resource clients now
-from azure.mgmt.containerinstance import ContainerInstanceManagementClient, models as AciModels
-from azure.mgmt.resource import ResourceManagementClient
+# Async (aio) clients so the pre-flight lookups can run concurrently
+from azure.identity.aio import DefaultAzureCredential, ManagedIdentityCredential
+from azure.mgmt.containerinstance.aio import ContainerInstanceManagementClient
+from azure.mgmt.resource.aio import ResourceManagementClient
 from azure.core.exceptions import HttpResponseError
-from azure.keyvault.secrets import SecretClient
+from azure.keyvault.secrets.aio import SecretClient
+from azure.storage.blob.aio import ContainerClient
+from azure.storage.fileshare.aio import ShareClient
+from azure.containerregistry.aio import ContainerRegistryClient
+import stub_clients
+import dbt_sharding
+import dbt_containers
+import delta_maintenance
+import run_state
 
 SCRIPT_DIR = Path(__file__).parent.absolute()
 app = func.FunctionApp()
+# Time the function keeps after waiting for dbt, for saving run state, refreshing versions and cleanup
+JOB_TIMEOUT_MARGIN_SECONDS = 120
+
+# Reused across warm invocations of the same worker
+_credential = None
+_arm_template_cache = {}  # path -> (mtime, parsed template)
 
 # === Authentication Helper ===
 def get_azure_credential():
+    global _credential
+    if _credential is not None:
+        return _credential
+    if use_stub_clients():
+        _credential = stub_clients.StubCredential()
+        return _credential
     managed_identity_client_id = os.environ.get("AZURE_CLIENT_ID") # Function App's UAMI Client ID
     if managed_identity_client_id:
         logging.info(f"Using ManagedIdentityCredential with Client ID: {managed_identity_client_id}")
-        return ManagedIdentityCredential(client_id=managed_identity_client_id)
+        _credential = ManagedIdentityCredential(client_id=managed_identity_client_id)
     else:
         logging.info("AZURE_CLIENT_ID not set, using DefaultAzureCredential (likely System-Assigned MI).")
-        return DefaultAzureCredential()
+        _credential = DefaultAzureCredential()
+    return _credential
+
+
+def use_stub_clients():
+    return os.environ.get("ORCHESTRATOR_USE_STUBS", "false").lower() == "true"
+
+
+def create_clients(config, credential):
+    """Returns (resource_client, aci_client, secret_client); stubbed when ORCHESTRATOR_USE_STUBS=true."""
+    if use_stub_clients():
+        logging.warning("ORCHESTRATOR_USE_STUBS is set, using in-process stub Azure clients.")
+        return (stub_clients.StubResourceClient(credential, config["SUBSCRIPTION_ID"]),
+                stub_clients.StubContainerInstanceClient(credential, config["SUBSCRIPTION_ID"]),
+                stub_clients.StubSecretClient(vault_url=config["KEY_VAULT_URI"], credential=credential))
+    return (ResourceManagementClient(credential, config["SUBSCRIPTION_ID"]),
+            ContainerInstanceManagementClient(credential, config["SUBSCRIPTION_ID"]),
+            SecretClient(vault_url=config["KEY_VAULT_URI"], credential=credential))
+
+
+def create_deployment_backend(config, resource_client, aci_client, arm_json_template, fast_start=False, share_client=None):
+    """
+    Deploys (or, in fast-start mode, restarts) dbt job containers and reports their exit codes; faked with stubs.
+    Fast-start jobs read their selection from the project file share (`share_client`).
+    """
+    if use_stub_clients():
+        return stub_clients.FakeDeploymentBackend()
+    if fast_start:
+        return dbt_containers.FastStartBackend(resource_client, aci_client, config["RESOURCE_GROUP"], arm_json_template,
+                                               share_client)
+    return dbt_sharding.ArmDeploymentBackend(resource_client, aci_client, config["RESOURCE_GROUP"], arm_json_template)
+
+
+def create_project_share_client(config, storage_account_key):
+    return ShareClient(account_url=f"https://{config['STORAGE_ACCT_NAME']}.file.core.windows.net",
+                       share_name=config["DBT_PROJECT_FILE_SHARE_NAME"], credential=storage_account_key)
+
+
+def create_project_source(config, change_config, fast_start_config, storage_account_key, credential):
+    """Returns (project_source, client_to_close) for fingerprinting the dbt project the job runs."""
+    if change_config["DBT_PROJECT_LOCAL_DIR"] or use_stub_clients():
+        return run_state.LocalProjectSource(change_config["DBT_PROJECT_LOCAL_DIR"] or SCRIPT_DIR / "dbt-project"), None
+    if fast_start_config["DBT_FAST_START"]:
+        # Fast-start jobs run the project baked into the image, not the one on the file share
+        repository, _, tag = fast_start_config["DBT_FAST_START_IMAGE"].partition(":")
+        registry_client = ContainerRegistryClient(f"https://{config['ACR_LOGIN_SERVER']}", credential)
+        return run_state.ImageProjectSource(registry_client, repository, tag or "latest"), registry_client
+    share_client = create_project_share_client(config, storage_account_key)
+    return run_state.FileShareProjectSource(share_client), share_client
+
+
+def create_raw_data_source(config, change_config, storage_account_key):
+    """Returns (raw_source, client_to_close) for fingerprinting the raw files the landing models load, if configured."""
+    raw_data_path = change_config["DBT_RAW_DATA_PATH"]
+    if not raw_data_path:
+        return None, None
+    if not raw_data_path.startswith("abfss://"):
+        return run_state.LocalRawDataSource(raw_data_path), None
+    # abfss://<container>@<account>.dfs.core.windows.net/<prefix>
+    location = urlparse(raw_data_path)
+    container_name, _, host = location.netloc.partition("@")
+    container_client = ContainerClient(account_url=f"https://{host.split('.')[0]}.blob.core.windows.net",
+                                       container_name=container_name, credential=storage_account_key)
+    return run_state.BlobRawDataSource(container_client, location.path), container_client
+
+
+def create_state_store(config, change_config, storage_account_key):
+    """Returns (state_store, client_to_close) holding the last successful run's fingerprint."""
+    if change_config["DBT_STATE_STORE"] == "local" or use_stub_clients():
+        return run_state.LocalFileStateStore(change_config["DBT_STATE_PATH"]), None
+    container_client = ContainerClient(account_url=f"https://{config['STORAGE_ACCT_NAME']}.blob.core.windows.net",
+                                       container_name=config["DELTA_CONTAINER_NAME"], credential=storage_account_key)
+    return run_state.BlobStateStore(container_client, change_config["DBT_STATE_PATH"]), container_client
+
+
+# === Timing Helper ===
+class PhaseTimer:
+    """
+    Collects wall-clock durations (seconds) for the named phases of one invocation and logs
+    each as a JSON record, tagged with the invocation's trace id, for querying in App Insights.
+    """
+
+    def __init__(self, function_name, trace_id=None):
+        self.function_name = function_name
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.fields = {}
+        self.started = time.perf_counter()
+        self.timings = {}
+
+    def annotate(self, **fields):
+        """Adds fields (e.g. the dbt job name) to every record logged after this call."""
+        self.fields.update(fields)
+
+    def log_event(self, event, **fields):
+        logging.info(json.dumps({"event": event, "function": self.function_name, "trace_id": self.trace_id,
+                                 **self.fields, **fields}))
+
+    async def timed(self, name, awaitable):
+        phase_start = time.perf_counter()
+        succeeded = False
+        try:
+            result = await awaitable
+            succeeded = True
+            return result
+        finally:
+            self.timings[name] = round(time.perf_counter() - phase_start, 3)
+            self.log_event("phase", phase=name, seconds=self.timings[name], succeeded=succeeded)
+
+    def summary(self):
+        return {**self.timings, "total": round(time.perf_counter() - self.started, 3)}
+
+    def log_summary(self, succeeded):
+        self.log_event("invocation", succeeded=succeeded, phases=self.summary())
+
+    def log_job_results(self, results, fast_start):
+        """Logs one record per dbt job, with its start mode and time to first model."""
+        for result in results:
+            self.log_event("dbt_job", fast_start=fast_start, **result)
+
+
+# === Pre-flight Helpers ===
+async def get_secret_value(secret_client, secret_name):
+    retrieved_secret = await secret_client.get_secret(secret_name)
+    if not retrieved_secret.value:
+        raise ValueError(f"Retrieved secret value '{secret_name}' from Key Vault is empty.")
+    return retrieved_secret.value
+
+
+async def get_uc_aci_fqdn(aci_client, resource_group, uc_aci_name):
+    logging.info(f"Retrieving Public FQDN for UC ACI '{uc_aci_name}'...")
+    try:
+        uc_aci_instance = await aci_client.container_groups.get(resource_group, uc_aci_name)
+        uc_aci_fqdn = uc_aci_instance.ip_address.fqdn if uc_aci_instance.ip_address else None
+        if not uc_aci_fqdn: raise ValueError("Failed to retrieve Public FQDN for UC ACI.")
+        logging.info(f"UC ACI Public FQDN: {uc_aci_fqdn}")
+        return uc_aci_fqdn
+    except Exception as e:
+        logging.error(f"Failed to get UC ACI FQDN: {e}")
+        raise
+
+
+def function_timeout_seconds(host_json_path=SCRIPT_DIR / "host.json", default=600):
+    """functionTimeout from host.json ("hh:mm:ss") in seconds; the Consumption plan default if unset."""
+    try:
+        hours, minutes, seconds = json.loads(host_json_path.read_text())["functionTimeout"].split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (OSError, KeyError, ValueError) as e:
+        logging.warning(f"Could not read functionTimeout from {host_json_path} ({e}), assuming {default}s.")
+        return default
+
+
+def job_timeout_seconds():
+    """How long to wait for dbt jobs: DBT_JOB_TIMEOUT_SECONDS, or functionTimeout minus the margin."""
+    limit = function_timeout_seconds() - JOB_TIMEOUT_MARGIN_SECONDS
+    timeout = float(os.environ.get("DBT_JOB_TIMEOUT_SECONDS", limit))
+    if timeout > limit:
+        logging.warning(f"DBT_JOB_TIMEOUT_SECONDS={timeout:g} leaves less than {JOB_TIMEOUT_MARGIN_SECONDS}s of "
+                        f"functionTimeout after the dbt job; the run state may not get saved.")
+    return timeout
+
+
+def load_arm_template(json_template_path):
+    """Parses the ARM template once per worker, re-reading only if the file changed."""
+    if not json_template_path.is_file(): raise FileNotFoundError(f"ARM template not found: {json_template_path}")
+    mtime = json_template_path.stat().st_mtime
+    cached = _arm_template_cache.get(json_template_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    logging.info(f"Loading ARM template: {json_template_path.name}")
+    try:
+        with open(json_template_path, 'r') as f: arm_json_template = json.load(f)
+    except Exception as e:
+        logging.error(f"Failed to load/parse ARM template: {e}")
+        raise
+    if not arm_json_template: raise ValueError("ARM template is empty.")
+    _arm_template_cache[json_template_path] = (mtime, arm_json_template)
+    return arm_json_template
 
 # === Main Timer Function ===
 @app.function_name(name="dbtOrchestratorTimer")
 @app.timer_trigger(schedule="0 0 7 * * *", # 7 AM UTC daily
                    arg_name="myTimer", run_on_startup=False, use_monitor=True)
-def timer_trigger_handler(myTimer: func.TimerRequest) -> None:
+async def timer_trigger_handler(myTimer: func.TimerRequest, context: func.Context) -> None:
     utc_timestamp = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()
     if myTimer.past_due: logging.warning('The timer is past due!')
     logging.info('Python timer trigger function ran at %s', utc_timestamp)
+    timer = PhaseTimer("dbtOrchestratorTimer", trace_id=context.invocation_id)
+    succeeded = False
 
     try:
         # --- Simplified Configuration ---
@@ -62,126 +265,314 @@ def timer_trigger_handler(myTimer: func.TimerRequest) -> None:
         missing_vars = [k for k, v in config.items() if not v]
         if missing_vars:
              raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
+        # Wait for the ARM deployment to finish instead of returning once it is accepted
+        wait_for_deployment = os.environ.get("DBT_WAIT_FOR_DEPLOYMENT", "false").lower() == "true"
+        # Wait for the dbt container to exit, to fail on dbt errors and log the time to first model
+        wait_for_exit = os.environ.get("DBT_WAIT_FOR_EXIT", "false").lower() == "true"
+        # Restart a long-lived container group running the project baked into the dbt image
+        fast_start_config = {
+            "DBT_FAST_START": os.environ.get("DBT_FAST_START", "false").lower() == "true",
+            "DBT_FAST_START_GROUP_NAME": os.environ.get("DBT_FAST_START_GROUP_NAME", "dbt-job-runner"),
+            "DBT_FAST_START_PROJECT_DIR": os.environ.get("DBT_FAST_START_PROJECT_DIR", "/usr/app/dbt/dbt-project"),
+            "DBT_FAST_START_IMAGE": os.environ.get("DBT_FAST_START_IMAGE", "dbt-server:latest"), # Image in dbt-job.json
+            "DBT_CLEANUP_JOB_GROUPS": os.environ.get("DBT_CLEANUP_JOB_GROUPS", "true").lower() == "true",
+            "DBT_JOB_GROUP_RETENTION_HOURS": float(os.environ.get("DBT_JOB_GROUP_RETENTION_HOURS", "24")),
+        }
+        fast_start = fast_start_config["DBT_FAST_START"]
+        # Split the dbt DAG into independent groups and run one job per group in parallel
+        shard_config = {
+            "DBT_SHARD_JOBS": os.environ.get("DBT_SHARD_JOBS", "false").lower() == "true",
+            "DBT_MANIFEST_PATH": os.environ.get("DBT_MANIFEST_PATH", "dbt-project/target/manifest.json"),
+            "DBT_MAX_PARALLEL_JOBS": int(os.environ.get("DBT_MAX_PARALLEL_JOBS", "4")),
+            "DBT_MODELS_PER_CORE": int(os.environ.get("DBT_MODELS_PER_CORE", "4")),
+            "DBT_MAX_CPU_CORES": int(os.environ.get("DBT_MAX_CPU_CORES", "4")),
+            "DBT_JOB_POLL_SECONDS": float(os.environ.get("DBT_JOB_POLL_SECONDS", "15")),
+            "DBT_JOB_TIMEOUT_SECONDS": job_timeout_seconds(), # Defaults to host.json functionTimeout minus a margin
+        }
+        # Skip the run, or only run the affected models, when inputs didn't change since the last successful run
+        change_config = {
+            "DBT_CHANGE_AWARE": os.environ.get("DBT_CHANGE_AWARE", "false").lower() == "true",
+            "DBT_STATE_STORE": os.environ.get("DBT_STATE_STORE", "blob").lower(), # "blob" (Delta container) or "local"
+            "DBT_STATE_PATH": os.environ.get("DBT_STATE_PATH", "orchestrator/dbt_run_state.json"), # Blob name or file path
+            "DBT_PROJECT_LOCAL_DIR": os.environ.get("DBT_PROJECT_LOCAL_DIR"), # Hash a local copy instead of the file share
+            "DBT_RAW_DATA_PATH": os.environ.get("DBT_RAW_DATA_PATH"), # raw_data_path of the landing models (abfss:// or local)
+        }
 
         credential = get_azure_credential()
-        resource_client = ResourceManagementClient(credential, config["SUBSCRIPTION_ID"])
-        aci_client = ContainerInstanceManagementClient(credential, config["SUBSCRIPTION_ID"])
-        secret_client = SecretClient(vault_url=config["KEY_VAULT_URI"], credential=credential)
-        
-        # Get the storage account key from Key Vault
-        storage_account_key = None
-        # Create the Key Vault Secret Client
-        retrieved_secret = secret_client.get_secret(config["DBT_STORAGE_KEY_SECRET_NAME"])
-        storage_account_key = retrieved_secret.value # Get the actual secret value
-        if not storage_account_key:
-            raise ValueError("Retrieved secret value from Key Vault is empty.")
-        
-        # Get the admin token from the Key Vault
-        admin_token = None
-        # Create the Key Vault Secret Client
-        retrieved_secret = secret_client.get_secret(config["UC_ADMIN_TOKEN"])
-        admin_token = retrieved_secret.value # Get the actual secret value
-        if not admin_token:
-            raise ValueError("Retrieved secret value from Key Vault is empty.")
-        
-
-        # --- Step 1: Get UC ACI FQDN ---
-        logging.info(f"Retrieving Public FQDN for UC ACI '{config['UC_ACI_NAME']}'...")
-        try:
-            uc_aci_instance = aci_client.container_groups.get(config["RESOURCE_GROUP"], config["UC_ACI_NAME"])
-            uc_aci_fqdn = uc_aci_instance.ip_address.fqdn if uc_aci_instance.ip_address else None
-            if not uc_aci_fqdn: raise ValueError("Failed to retrieve Public FQDN for UC ACI.")
-            logging.info(f"UC ACI Public FQDN: {uc_aci_fqdn}")
-        except Exception as e:
-            logging.error(f"Failed to get UC ACI FQDN: {e}")
-            raise
-
-        # --- Step 2: Retrieve Token from UC ACI ---
-        logging.info(f"Retrieving UC token from {config['UC_ACI_NAME']} via SDK exec...")
-        uc_token_value = None
-        try:
+        resource_client, aci_client, secret_client = create_clients(config, credential)
+        async with resource_client, aci_client, secret_client, AsyncExitStack() as state_clients:
+
+            # --- Steps 1-3: Key Vault secrets, UC ACI FQDN and ARM template, fetched concurrently ---
+            json_template_path = SCRIPT_DIR / config["DBT_JOB_JSON_FILE_NAME"]
+            storage_account_key, admin_token, uc_aci_fqdn, arm_json_template = await timer.timed("preflight", asyncio.gather(
+                timer.timed("keyvault_storage_key", get_secret_value(secret_client, config["DBT_STORAGE_KEY_SECRET_NAME"])),
+                timer.timed("keyvault_uc_token", get_secret_value(secret_client, config["UC_ADMIN_TOKEN"])),
+                timer.timed("aci_fqdn_lookup", get_uc_aci_fqdn(aci_client, config["RESOURCE_GROUP"], config["UC_ACI_NAME"])),
+                timer.timed("template_load", asyncio.to_thread(load_arm_template, json_template_path)),
+            ))
             uc_token_value = admin_token # Use the admin token from Key Vault
-            if not uc_token_value: raise ValueError("Token not found in exec response.")
             logging.info("UC Token retrieved successfully.")
-        except Exception as e:
-            logging.error(f"Failed to execute command on UC ACI or retrieve token: {e}")
-            raise
-
-        # --- Step 3: Load Pre-compiled ARM Template ---
-        logging.info(f"Loading ARM template: {config['DBT_JOB_JSON_FILE_NAME']}")
-        json_template_path = SCRIPT_DIR / config["DBT_JOB_JSON_FILE_NAME"]
-        if not json_template_path.is_file(): raise FileNotFoundError(f"ARM template not found: {json_template_path}")
-        arm_json_template = None
-        try:
-            with open(json_template_path, 'r') as f: arm_json_template = json.load(f)
-        except Exception as e:
-            logging.error(f"Failed to load/parse ARM template: {e}")
-            raise
-        if not arm_json_template: raise ValueError("ARM template is empty.")
-
-        # --- Step 4: Construct Parameters for dbt job ---
-        job_instance_name = f"dbt-job-{int(datetime.datetime.utcnow().timestamp())}"
-        uc_server_url = f"http://{uc_aci_fqdn}:8080"
-        # Construct storage path (assuming container/account names are from config)
-        storage_path = f"abfss://{config['DELTA_CONTAINER_NAME']}@{config['STORAGE_ACCT_NAME']}.dfs.core.windows.net/delta-tables"
-
-        arm_parameters = {
-             "dbtJobInstanceName": {"value": job_instance_name},
-             "acrLoginServer": {"value": config["ACR_LOGIN_SERVER"]},
-             # Omit acrUsername/acrPassword if using MI pull
-             "uamiResourceId": {"value": config["UAMI_RESOURCE_ID"]},
-             "subnetId": {"value": os.environ.get("ACI_SUBNET_ID")}, # Get Subnet ID from env vars too
-             "location": {"value": config["LOCATION"]},
-             "dbtProjectStorageAccountName": {"value": config["STORAGE_ACCT_NAME"]},
-             "storageAccountKey": {"value": storage_account_key}, # <-- Use fetched key
-             "subnetId": {"value": config["ACI_SUBNET_ID"]}, # <-- Ensure this uses the config value
-             "dbtProjectFileShareName": {"value": config["DBT_PROJECT_FILE_SHARE_NAME"]},
-             "ucAdminTokenValue": {"value": uc_token_value},
-             "ucServerUrl": {"value": uc_server_url},
-             "storagePath": {"value": storage_path},
-             "dbtCommandToRun": {"value": config["DBT_COMMAND"]},
-             "memoryInGB": {"value": config["DBT_MEMORY_GB"]},
-             "cpuCores": {"value": config["DBT_CPU_CORES"]}
-        }
 
+            # --- Step 4: Construct Parameters for dbt job ---
+            if fast_start:
+                job_instance_name = fast_start_config["DBT_FAST_START_GROUP_NAME"]
+            else:
+                job_instance_name = f"dbt-job-{int(datetime.datetime.utcnow().timestamp())}"
+            timer.annotate(dbt_job=job_instance_name)
+            uc_server_url = f"http://{uc_aci_fqdn}:8080"
+            # Construct storage path (assuming container/account names are from config)
+            storage_path = f"abfss://{config['DELTA_CONTAINER_NAME']}@{config['STORAGE_ACCT_NAME']}.dfs.core.windows.net/delta-tables"
 
-        # Add ACR creds if needed
-        # if config.get("ACR_PASSWORD"):
-        #     arm_parameters["acrUsername"] = {"value": config.get("ACR_USERNAME")}
-        #     arm_parameters["acrPassword"] = {"value": config.get("ACR_PASSWORD")}
+            arm_parameters = {
+                 "dbtJobInstanceName": {"value": job_instance_name},
+                 "acrLoginServer": {"value": config["ACR_LOGIN_SERVER"]},
+                 # Omit acrUsername/acrPassword if using MI pull
+                 "uamiResourceId": {"value": config["UAMI_RESOURCE_ID"]},
+                 "location": {"value": config["LOCATION"]},
+                 "dbtProjectStorageAccountName": {"value": config["STORAGE_ACCT_NAME"]},
+                 "storageAccountKey": {"value": storage_account_key}, # <-- Use fetched key
+                 "subnetId": {"value": config["ACI_SUBNET_ID"]}, # <-- Ensure this uses the config value
+                 "dbtProjectFileShareName": {"value": config["DBT_PROJECT_FILE_SHARE_NAME"]},
+                 "ucAdminTokenValue": {"value": uc_token_value},
+                 "ucServerUrl": {"value": uc_server_url},
+                 "storagePath": {"value": storage_path},
+                 "dbtCommandToRun": {"value": config["DBT_COMMAND"]},
+                 "memoryInGB": {"value": config["DBT_MEMORY_GB"]},
+                 "cpuCores": {"value": config["DBT_CPU_CORES"]}
+            }
+            if fast_start:
+                arm_parameters["dbtProjectDir"] = {"value": fast_start_config["DBT_FAST_START_PROJECT_DIR"]}
 
 
-        # --- Step 5: Deploy dbt Job ACI ---
-        deployment_name = f"dbt-job-deploy-{job_instance_name}"
-        deployment_properties = {'mode': 'Incremental', 'template': arm_json_template, 'parameters': arm_parameters}
-        logging.info(f"Submitting ARM deployment '{deployment_name}'...")
-        try:
-            poller = resource_client.deployments.begin_create_or_update(
-                 config["RESOURCE_GROUP"], deployment_name, {'properties': deployment_properties}
-            )
-            logging.info(f"Waiting for deployment '{deployment_name}'...")
-            final_deployment_state = poller.result() # Wait for completion
-            logging.info(f"Deployment completed with state: {final_deployment_state.properties.provisioning_state}")
-            if final_deployment_state.properties.provisioning_state != "Succeeded":
-                 # Simplified error reporting, enhance if needed
-                 raise Exception(f"Deployment failed: {final_deployment_state.properties.error}")
-        except HttpResponseError as deployment_error:
-            logging.error(f"ARM Deployment failed: {deployment_error}")
-            # Attempt to get more details if possible
-            try:
-                 error_info = deployment_error.model.error.details if deployment_error.model and deployment_error.model.error else "No details"
-                 logging.error(f"Deployment error details: {error_info}")
-            except Exception:
-                 pass # Ignore errors getting more details
-            raise deployment_error # Re-raise original error
-        except Exception as e:
-            logging.error(f"An unexpected error occurred during deployment submission/polling: {e}")
-            raise
+            # Add ACR creds if needed
+            # if config.get("ACR_PASSWORD"):
+            #     arm_parameters["acrUsername"] = {"value": config.get("ACR_USERNAME")}
+            #     arm_parameters["acrPassword"] = {"value": config.get("ACR_PASSWORD")}
+
+
+            # --- Step 4a: Compare the run's inputs with the last successful run (optional) ---
+            state_store = current_state = run_selector = None
+            if change_config["DBT_CHANGE_AWARE"]:
+                project_source, project_client = create_project_source(
+                    config, change_config, fast_start_config, storage_account_key, credential)
+                state_store, container_client = create_state_store(config, change_config, storage_account_key)
+                raw_source, raw_client = create_raw_data_source(config, change_config, storage_account_key)
+                for client in (project_client, container_client, raw_client):
+                    if client is not None:
+                        state_clients.push_async_callback(client.close)
+                manifest_path = SCRIPT_DIR / shard_config["DBT_MANIFEST_PATH"]
+                manifest = await asyncio.to_thread(dbt_sharding.load_manifest, manifest_path) if manifest_path.is_file() else None
+                if manifest is None:
+                    logging.error(f"dbt manifest not found at {manifest_path}, so changes can't be mapped to models and "
+                                  f"every changed run runs the whole project. Run `dbt parse` in the function's "
+                                  f"dbt-project before deploying (main.sh does this).")
+                storage_options = {"account_name": config["STORAGE_ACCT_NAME"], "account_key": storage_account_key}
+                current_state, previous_state = await timer.timed("change_detection", asyncio.gather(
+                    run_state.fingerprint(project_source, manifest, None if use_stub_clients() else uc_server_url,
+                                          uc_token_value, storage_options, raw_source),
+                    state_store.load()))
+                decision, detail = run_state.plan_run(manifest, previous_state, current_state)
+                timer.log_event("change_detection", decision=decision, detail=detail)
+                if decision == "skip":
+                    logging.info(f"--- Skipping the dbt run: {detail} ---")
+                    succeeded = True
+                    return
+                if decision == "select":
+                    logging.info(f"Running only the affected models: {detail}")
+                    run_selector = detail
+                    arm_parameters["dbtSelector"] = {"value": run_selector}
+                else:
+                    logging.info(f"Running the whole project: {detail}")
+
+            # Fast-start jobs read their selection from the project share, so it isn't part of the group's configuration
+            selector_share_client = None
+            if fast_start and not use_stub_clients():
+                selector_share_client = create_project_share_client(config, storage_account_key)
+                state_clients.push_async_callback(selector_share_client.close)
+
+            # --- Step 4b: Plan parallel dbt jobs from the manifest (optional) ---
+            shard_jobs = []
+            if shard_config["DBT_SHARD_JOBS"] and run_selector:
+                logging.info("A change-based selection is set, running it as a single dbt job instead of sharding.")
+            elif shard_config["DBT_SHARD_JOBS"]:
+                manifest_path = SCRIPT_DIR / shard_config["DBT_MANIFEST_PATH"]
+                if manifest_path.is_file():
+                    manifest = await asyncio.to_thread(dbt_sharding.load_manifest, manifest_path)
+                    shard_jobs = dbt_sharding.plan_jobs(
+                        manifest,
+                        max_parallel_jobs=shard_config["DBT_MAX_PARALLEL_JOBS"],
+                        models_per_core=shard_config["DBT_MODELS_PER_CORE"],
+                        max_cpu_cores=shard_config["DBT_MAX_CPU_CORES"],
+                        min_cpu_cores=config["DBT_CPU_CORES"],
+                        memory_gb_per_core=config["DBT_MEMORY_GB"])
+                    logging.info(f"Planned {len(shard_jobs)} parallel dbt job(s): {json.dumps(shard_jobs)}")
+                else:
+                    logging.error(f"dbt manifest not found at {manifest_path}, falling back to a single dbt job. Run "
+                                  f"`dbt parse` in the function's dbt-project before deploying (main.sh does this).")
+
+            if shard_jobs:
+                # --- Step 5 (sharded): Deploy one dbt Job ACI per group and wait for all of them ---
+                backend = create_deployment_backend(config, resource_client, aci_client, arm_json_template, fast_start,
+                                                    selector_share_client)
+                jobs = []
+                for index, job in enumerate(shard_jobs):
+                    name = f"{job_instance_name}-{index}"
+                    jobs.append((name, {
+                        **arm_parameters,
+                        "dbtJobInstanceName": {"value": name},
+                        "dbtSelector": {"value": job["selector"]},
+                        "cpuCores": {"value": job["cpu_cores"]},
+                        "memoryInGB": {"value": job["memory_gb"]},
+                    }))
+                all_succeeded, results = await timer.timed("sharded_jobs", dbt_sharding.run_jobs(
+                    backend, jobs,
+                    poll_interval_seconds=shard_config["DBT_JOB_POLL_SECONDS"],
+                    timeout_seconds=shard_config["DBT_JOB_TIMEOUT_SECONDS"]))
+                timer.log_job_results(results, fast_start)
+                if not all_succeeded:
+                    failed = [r["job"] for r in results if not r["succeeded"]]
+                    raise Exception(f"{len(failed)} of {len(results)} dbt job(s) failed: {', '.join(failed)}")
+                logging.info(f"--- All {len(results)} dbt jobs completed successfully ---")
+            elif change_config["DBT_CHANGE_AWARE"] or fast_start or wait_for_exit:
+                # --- Step 5 (waiting): Deploy or restart the dbt Job ACI and wait for it to exit ---
+                # The change-aware state may only be saved once dbt succeeded, so this path can't return early
+                backend = create_deployment_backend(config, resource_client, aci_client, arm_json_template, fast_start,
+                                                    selector_share_client)
+                all_succeeded, results = await timer.timed("dbt_job", dbt_sharding.run_jobs(
+                    backend, [(job_instance_name, arm_parameters)],
+                    poll_interval_seconds=shard_config["DBT_JOB_POLL_SECONDS"],
+                    timeout_seconds=shard_config["DBT_JOB_TIMEOUT_SECONDS"]))
+                timer.log_job_results(results, fast_start)
+                if not all_succeeded:
+                    raise Exception(f"dbt job '{job_instance_name}' failed: {results[0].get('error') or results[0]['exit_code']}")
+            else:
+                # --- Step 5: Deploy dbt Job ACI ---
+                deployment_name = f"dbt-job-deploy-{job_instance_name}"
+                deployment_properties = {'mode': 'Incremental', 'template': arm_json_template, 'parameters': arm_parameters}
+                logging.info(f"Submitting ARM deployment '{deployment_name}'...")
+                try:
+                    poller = await timer.timed("deployment_submit", resource_client.deployments.begin_create_or_update(
+                         config["RESOURCE_GROUP"], deployment_name, {'properties': deployment_properties}
+                    ))
+                    if wait_for_deployment:
+                        logging.info(f"Waiting for deployment '{deployment_name}'...")
+                        final_deployment_state = await timer.timed("deployment_wait", poller.result()) # Wait for completion
+                        logging.info(f"Deployment completed with state: {final_deployment_state.properties.provisioning_state}")
+                        if final_deployment_state.properties.provisioning_state != "Succeeded":
+                             # Simplified error reporting, enhance if needed
+                             raise Exception(f"Deployment failed: {final_deployment_state.properties.error}")
+                    else:
+                        # ARM keeps provisioning server-side; no need to hold the function open
+                        logging.info(f"Deployment '{deployment_name}' accepted, not waiting for completion.")
+                except HttpResponseError as deployment_error:
+                    logging.error(f"ARM Deployment failed: {deployment_error}")
+                    # Attempt to get more details if possible
+                    try:
+                         error_info = deployment_error.model.error.details if deployment_error.model and deployment_error.model.error else "No details"
+                         logging.error(f"Deployment error details: {error_info}")
+                    except Exception:
+                         pass # Ignore errors getting more details
+                    raise deployment_error # Re-raise original error
+                except Exception as e:
+                    logging.error(f"An unexpected error occurred during deployment submission/polling: {e}")
+                    raise
+
+            # --- Step 6: Delete the container groups of earlier per-run deployments ---
+            if fast_start_config["DBT_CLEANUP_JOB_GROUPS"]:
+                try:
+                    deleted = await timer.timed("cleanup_job_groups", dbt_containers.cleanup_job_groups(
+                        aci_client, config["RESOURCE_GROUP"], fast_start_config["DBT_JOB_GROUP_RETENTION_HOURS"]))
+                    if deleted:
+                        logging.info(f"Deleted {len(deleted)} old dbt job container group(s): {', '.join(deleted)}")
+                except Exception as e:
+                    logging.warning(f"Could not clean up old dbt job container groups: {e}")
+
+            # --- Step 7: Record the inputs of this successful run for the next change detection ---
+            if state_store is not None:
+                # The run itself committed to the landing tables; record those versions so only outside commits count
+                landing_tables = run_state.input_tables(manifest, sources=False)
+                if landing_tables and not use_stub_clients():
+                    current_state["sources"].update(await timer.timed("landing_versions", run_state.table_versions(
+                        landing_tables, uc_server_url, uc_token_value, storage_options)))
+                await timer.timed("state_save", state_store.save({
+                    **current_state, "dbt_job": job_instance_name, "selector": run_selector,
+                    "saved_at": datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()}))
 
         logging.info("--- dbt Job ACI Deployment Submitted Successfully ---")
+        succeeded = True
 
     except Exception as e:
         logging.exception(f"An error occurred during function execution: {e}")
         raise # Ensure Functions runtime knows it failed
+    finally:
+        timer.log_summary(succeeded)
 
-    logging.info(f"Python timer trigger function finished at {datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()}")
\ No newline at end of file
+    logging.info(f"Python timer trigger function finished at {datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()}")
+
+
+# === Delta Maintenance Timer ===
+@app.function_name(name="deltaMaintenanceTimer")
+@app.timer_trigger(schedule="0 0 9 * * *", # 9 AM UTC daily, after the dbt run
+                   arg_name="myTimer", run_on_startup=False, use_monitor=True)
+async def delta_maintenance_handler(myTimer: func.TimerRequest, context: func.Context) -> None:
+    if myTimer.past_due: logging.warning('The timer is past due!')
+    timer = PhaseTimer("deltaMaintenanceTimer", trace_id=context.invocation_id)
+    succeeded = False
+
+    try:
+        maintenance_config = {
+            "target_file_size": int(os.environ.get("DELTA_TARGET_FILE_SIZE", "134217728")), # Same as +target_file_size in dbt_project.yml
+            "checkpoint_interval": int(os.environ.get("DELTA_CHECKPOINT_INTERVAL", "10")), # Commits between checkpoints
+            "vacuum_retention_hours": int(os.environ.get("DELTA_VACUUM_RETENTION_HOURS", "168")),
+            "vacuum_dry_run": os.environ.get("DELTA_VACUUM_DRY_RUN", "false").lower() == "true",
+        }
+        max_concurrency = int(os.environ.get("DELTA_MAINTENANCE_CONCURRENCY", "4"))
+        # Walk a local/mounted directory instead of asking Unity Catalog (local testing)
+        local_root = os.environ.get("DELTA_MAINTENANCE_LOCAL_ROOT")
+
+        if local_root:
+            table_uris = delta_maintenance.discover_local_tables(local_root)
+            storage_options = None
+        else:
+            config = {
+                "SUBSCRIPTION_ID": os.environ.get("AZURE_SUBSCRIPTION_ID"),
+                "RESOURCE_GROUP": os.environ.get("RESOURCE_GROUP"),
+                "STORAGE_ACCT_NAME": os.environ.get("STORAGE_ACCT_NAME"),
+                "UC_ACI_NAME": os.environ.get("UC_ACI_NAME"),
+                "KEY_VAULT_URI": os.environ.get("KEY_VAULT_URI"),
+                "DBT_STORAGE_KEY_SECRET_NAME": os.environ.get("DBT_STORAGE_KEY_SECRET_NAME", "dbt-storage-account-key"),
+                "UC_ADMIN_TOKEN": os.environ.get("UC_ADMIN_TOKEN", "uc-admin-key"),
+            }
+            missing_vars = [k for k, v in config.items() if not v]
+            if missing_vars:
+                raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
+            catalogs = [c.strip() for c in os.environ.get("DELTA_MAINTENANCE_CATALOGS", "").split(",") if c.strip()]
+
+            credential = get_azure_credential()
+            resource_client, aci_client, secret_client = create_clients(config, credential)
+            async with resource_client, aci_client, secret_client:
+                storage_account_key, admin_token, uc_aci_fqdn = await timer.timed("preflight", asyncio.gather(
+                    get_secret_value(secret_client, config["DBT_STORAGE_KEY_SECRET_NAME"]),
+                    get_secret_value(secret_client, config["UC_ADMIN_TOKEN"]),
+                    get_uc_aci_fqdn(aci_client, config["RESOURCE_GROUP"], config["UC_ACI_NAME"]),
+                ))
+            table_uris = await timer.timed("discover_tables", delta_maintenance.discover_uc_tables(
+                f"http://{uc_aci_fqdn}:8080", admin_token, catalogs))
+            storage_options = {"account_name": config["STORAGE_ACCT_NAME"], "account_key": storage_account_key}
+
+        logging.info(f"Running Delta maintenance on {len(table_uris)} table(s): {json.dumps(maintenance_config)}")
+        reports = await timer.timed("maintenance", delta_maintenance.maintain_tables(
+            table_uris, max_concurrency=max_concurrency, storage_options=storage_options, **maintenance_config))
+        for report in reports:
+            logging.info(f"Delta maintenance: {json.dumps(report)}")
+        summary = delta_maintenance.summarize(reports)
+        logging.info(f"Delta maintenance summary: {json.dumps(summary)}")
+        if summary["failed"]:
+            raise Exception(f"Delta maintenance failed for {summary['failed']} of {summary['tables']} table(s).")
+        succeeded = True
+
+    except Exception as e:
+        logging.exception(f"An error occurred during Delta maintenance: {e}")
+        raise
+    finally:
+        timer.log_summary(succeeded)
@@ -0,0 +1,320 @@
+"""
+Change detection for the daily dbt run. The inputs of a run are fingerprinted and compared with
+the fingerprint stored after the last successful run, to either skip the run, select only the
+affected models (`<name>+`, like dbt's `state:modified+`), or run the whole project. The inputs are:
+
+- the hashes of the project's model/macro/seed files (seeds are the default raw data)
+- the Delta versions of the `landing_*` tables and of any dbt sources, resolved through Unity Catalog
+- the listing (names, sizes, modification times) of each dataset under the raw_data_path the
+  landing models load, when one is configured
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path, PurePosixPath
+
+# Project files that feed nodes; anything else (dbt_project.yml, profiles.yml, ...) forces a full run
+NODE_DIRECTORIES = ("models", "macros", "seeds", "snapshots", "tests")
+PROJECT_FILES = ("dbt_project.yml", "profiles.yml", "packages.yml", "dependencies.yml")
+NODE_RESOURCE_TYPES = {"model", "seed", "snapshot", "test"}
+# Models bulk-loading <raw_data_path>/raw_<name>/ are named landing_<name> (macros/raw_source.sql)
+LANDING_PREFIX = "landing_"
+RAW_PREFIX = "raw_"
+# Fingerprint key of a dbt image (fast-start jobs run the project baked into it): image:<repository>:<tag>
+IMAGE_PREFIX = "image:"
+
+
+def _is_project_input(path):
+    return path in PROJECT_FILES or PurePosixPath(path).parts[0] in NODE_DIRECTORIES
+
+
+# === Project sources ===
+class LocalProjectSource:
+    """Hashes the dbt project files in a local directory."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _hash_files(self):
+        hashes = {}
+        for path in sorted(self.root.rglob("*")):
+            relative = path.relative_to(self.root).as_posix()
+            if path.is_file() and _is_project_input(relative):
+                hashes[relative] = hashlib.sha256(path.read_bytes()).hexdigest()
+        return hashes
+
+    async def file_hashes(self):
+        return await asyncio.to_thread(self._hash_files)
+
+
+class FileShareProjectSource:
+    """
+    Hashes the dbt project files on an Azure File Share (azure.storage.fileshare.aio.ShareClient).
+    Uses the stored Content-MD5 when the upload set one and only downloads the other files.
+    """
+
+    def __init__(self, share_client, max_concurrency=8):
+        self.share_client = share_client
+        self.max_concurrency = max_concurrency
+
+    async def _list_files(self, directory=""):
+        paths = []
+        async for item in self.share_client.get_directory_client(directory).list_directories_and_files():
+            path = f"{directory}/{item['name']}" if directory else item["name"]
+            if not _is_project_input(path) and not (item["is_directory"] and path in NODE_DIRECTORIES):
+                continue
+            if item["is_directory"]:
+                paths += await self._list_files(path)
+            else:
+                paths.append(path)
+        return paths
+
+    async def _hash_file(self, path):
+        file_client = self.share_client.get_file_client(path)
+        properties = await file_client.get_file_properties()
+        content_md5 = properties.content_settings.content_md5
+        if content_md5:
+            return "md5:" + base64.b64encode(bytes(content_md5)).decode()
+        downloader = await file_client.download_file()
+        return hashlib.sha256(await downloader.readall()).hexdigest()
+
+    async def file_hashes(self):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def hash_file(path):
+            async with semaphore:
+                return path, await self._hash_file(path)
+
+        return dict(await asyncio.gather(*(hash_file(path) for path in await self._list_files())))
+
+
+class ImageProjectSource:
+    """
+    Fingerprints the dbt project baked into an image, which fast-start jobs run instead of the file
+    share, by the image's digest in ACR (azure.containerregistry.aio.ContainerRegistryClient).
+    The files inside the image can't be mapped to models, so any rebuild of the image runs the whole project.
+    """
+
+    def __init__(self, registry_client, repository, tag):
+        self.registry_client = registry_client
+        self.repository = repository
+        self.tag = tag
+
+    async def file_hashes(self):
+        properties = await self.registry_client.get_tag_properties(self.repository, self.tag)
+        return {f"{IMAGE_PREFIX}{self.repository}:{self.tag}": properties.digest}
+
+
+# === Raw data sources ===
+class LocalRawDataSource:
+    """Fingerprints each dataset directory (<root>/raw_<name>/) by its files' names, sizes and modification times."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _hash_datasets(self):
+        datasets = {}
+        for dataset in sorted(p for p in self.root.iterdir() if p.is_dir()) if self.root.is_dir() else []:
+            listing = [(path.relative_to(dataset).as_posix(), path.stat().st_size, path.stat().st_mtime_ns)
+                       for path in sorted(dataset.rglob("*")) if path.is_file()]
+            datasets[dataset.name] = hashlib.sha256(json.dumps(listing).encode()).hexdigest()
+        return datasets
+
+    async def dataset_hashes(self):
+        return await asyncio.to_thread(self._hash_datasets)
+
+
+class BlobRawDataSource:
+    """
+    Fingerprints each dataset (<prefix>/raw_<name>/...) in a blob container (azure.storage.blob.aio.ContainerClient)
+    by its blobs' names, sizes and ETags. Only the listing is read, not the data.
+    """
+
+    def __init__(self, container_client, prefix):
+        self.container_client = container_client
+        self.prefix = prefix.strip("/")
+
+    async def dataset_hashes(self):
+        start = f"{self.prefix}/" if self.prefix else ""
+        listings = {}
+        async for blob in self.container_client.list_blobs(name_starts_with=start):
+            dataset, _, path = blob.name[len(start):].partition("/")
+            if path:
+                listings.setdefault(dataset, []).append((path, blob.size, blob.etag))
+        return {dataset: hashlib.sha256(json.dumps(sorted(listing)).encode()).hexdigest()
+                for dataset, listing in sorted(listings.items())}
+
+
+# === State stores ===
+class LocalFileStateStore:
+    """Keeps the last successful run's fingerprint in a local JSON file (tests and local runs)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    async def load(self):
+        if not self.path.is_file():
+            return None
+        return json.loads(await asyncio.to_thread(self.path.read_text))
+
+    async def save(self, state):
+        def write():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(state, indent=2, sort_keys=True))
+            os.replace(tmp_path, self.path)
+        await asyncio.to_thread(write)
+
+
+class BlobStateStore:
+    """Keeps the last successful run's fingerprint in a blob (azure.storage.blob.aio.ContainerClient)."""
+
+    def __init__(self, container_client, blob_name):
+        self.blob_client = container_client.get_blob_client(blob_name)
+
+    async def load(self):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            downloader = await self.blob_client.download_blob()
+        except ResourceNotFoundError:
+            return None
+        return json.loads(await downloader.readall())
+
+    async def save(self, state):
+        await self.blob_client.upload_blob(json.dumps(state, indent=2, sort_keys=True), overwrite=True)
+
+
+# === Fingerprint ===
+def input_tables(manifest, sources=True, landing=True):
+    """
+    {unique_id: catalog.schema.table} of the tables a run reads but doesn't derive from other nodes:
+    the dbt sources and the landing models, which load the raw files.
+    """
+    tables = {}
+    if sources:
+        for unique_id, source in (manifest or {}).get("sources", {}).items():
+            tables[unique_id] = f"{source['database']}.{source['schema']}.{source.get('identifier') or source['name']}"
+    if landing:
+        for unique_id, node in (manifest or {}).get("nodes", {}).items():
+            if node["resource_type"] == "model" and node["name"].startswith(LANDING_PREFIX):
+                tables[unique_id] = f"{node['database']}.{node['schema']}.{node.get('alias') or node['name']}"
+    return tables
+
+
+async def table_versions(tables, uc_server_url, uc_token, storage_options=None):
+    """
+    {unique_id: Delta version} for {unique_id: full_name}, resolved through Unity Catalog.
+    A table that can't be resolved gets None, which always counts as changed.
+    """
+    import aiohttp
+    from deltalake import DeltaTable
+
+    if not tables:
+        return {}
+    versions = {}
+    headers = {"Authorization": f"Bearer {uc_token}"}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        for unique_id, full_name in tables.items():
+            try:
+                async with session.get(f"{uc_server_url}/api/2.1/unity-catalog/tables/{full_name}") as response:
+                    response.raise_for_status()
+                    location = (await response.json())["storage_location"]
+                table = await asyncio.to_thread(DeltaTable, location, storage_options=storage_options)
+                versions[unique_id] = table.version()
+            except Exception as e:
+                logging.warning(f"Could not get the Delta version of '{full_name}': {e}")
+                versions[unique_id] = None
+    return versions
+
+
+async def fingerprint(project_source, manifest=None, uc_server_url=None, uc_token=None, storage_options=None,
+                      raw_source=None):
+    files = await project_source.file_hashes()
+    tables = input_tables(manifest)
+    sources = await table_versions(tables, uc_server_url, uc_token, storage_options) if uc_server_url else {}
+    raw = await raw_source.dataset_hashes() if raw_source else {}
+    return {"files": files, "sources": sources, "raw": raw}
+
+
+# === Planning ===
+def _macros_depending_on(manifest, macro_ids):
+    """Expands a set of macro unique_ids with every macro that calls them, directly or indirectly."""
+    affected = set(macro_ids)
+    changed = True
+    while changed:
+        changed = False
+        for unique_id, macro in manifest.get("macros", {}).items():
+            if unique_id not in affected and affected & set(macro.get("depends_on", {}).get("macros", [])):
+                affected.add(unique_id)
+                changed = True
+    return affected
+
+
+def plan_run(manifest, previous, current):
+    """
+    Compares the current fingerprint with the last successful run's. Returns (decision, detail):
+    ("skip", reason), ("full", reason) or ("select", dbt selector of the affected nodes and their children).
+    """
+    if not previous:
+        return "full", "no previous successful run"
+    previous_files, current_files = previous.get("files", {}), current["files"]
+    changed_files = {path for path, digest in current_files.items() if previous_files.get(path) != digest}
+    deleted_files = set(previous_files) - set(current_files)
+    previous_sources = previous.get("sources", {})
+    changed_sources = {unique_id for unique_id, version in current["sources"].items()
+                       if version is None or previous_sources.get(unique_id) != version}
+    previous_raw, current_raw = previous.get("raw", {}), current.get("raw", {})
+    changed_raw = {dataset for dataset in set(previous_raw) | set(current_raw)
+                   if previous_raw.get(dataset) != current_raw.get(dataset)}
+
+    if not changed_files and not deleted_files and not changed_sources and not changed_raw:
+        return "skip", "no model, macro, seed, source, landing table or raw file changes since the last successful run"
+    if deleted_files:
+        return "full", f"files removed: {', '.join(sorted(deleted_files))}"
+    images = sorted(path for path in changed_files if path.startswith(IMAGE_PREFIX))
+    if images:
+        return "full", f"dbt image rebuilt: {', '.join(images)}"
+    project_config = sorted(path for path in changed_files if path in PROJECT_FILES)
+    if project_config:
+        return "full", f"project configuration changed: {', '.join(project_config)}"
+    if not manifest:
+        return "full", "no dbt manifest to map changes to models"
+
+    project_name = manifest.get("metadata", {}).get("project_name")
+    nodes = {unique_id: node for unique_id, node in manifest["nodes"].items()
+             if node["resource_type"] in NODE_RESOURCE_TYPES
+             and (project_name is None or node.get("package_name") == project_name)}
+    changed_macros = _macros_depending_on(manifest, {
+        unique_id for unique_id, macro in manifest.get("macros", {}).items()
+        if macro.get("package_name") == project_name and macro.get("original_file_path") in changed_files})
+
+    # New or changed raw files are loaded by their landing model, which then runs with everything downstream
+    node_names = {node["name"] for node in nodes.values()}
+    raw_models = {dataset: LANDING_PREFIX + dataset.removeprefix(RAW_PREFIX) for dataset in changed_raw}
+    unloaded = sorted(dataset for dataset, name in raw_models.items() if name not in node_names)
+    if unloaded:
+        return "full", f"raw data changed for datasets no landing model loads: {', '.join(unloaded)}"
+
+    affected, mapped_files = set(raw_models.values()), set()
+    for node in nodes.values():
+        patch_path = (node.get("patch_path") or "").split("://", 1)[-1]
+        node_files = {node.get("original_file_path"), patch_path} & changed_files
+        depends_on = node.get("depends_on", {})
+        if (node_files or changed_macros & set(depends_on.get("macros", []))
+                or changed_sources & set(depends_on.get("nodes", []))):
+            affected.add(node["name"])
+            mapped_files |= node_files
+    mapped_files |= {macro["original_file_path"] for unique_id, macro in manifest.get("macros", {}).items()
+                     if unique_id in changed_macros}
+
+    unmapped = changed_files - mapped_files
+    if unmapped:
+        # New files, or files the deployed manifest doesn't know about yet
+        return "full", f"changes not in the dbt manifest: {', '.join(sorted(unmapped))}"
+    if not affected:
+        return "skip", "changes don't affect any model, seed or test"
+    return "select", " ".join(f"{name}+" for name in sorted(affected))
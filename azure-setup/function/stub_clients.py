@@ -0,0 +1,120 @@
+"""
+In-process stand-ins for the async Azure SDK clients used by function_app.py.
+Enabled with ORCHESTRATOR_USE_STUBS=true so the orchestrator can be run locally
+without an Azure subscription. STUB_LATENCY_SECONDS simulates per-call latency.
+"""
+import asyncio
+import datetime
+import os
+from types import SimpleNamespace
+
+STUB_LATENCY_SECONDS = float(os.environ.get("STUB_LATENCY_SECONDS", "0.1"))
+
+
+async def _latency():
+    await asyncio.sleep(STUB_LATENCY_SECONDS)
+
+
+class _AsyncClient:
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class StubCredential(_AsyncClient):
+    async def get_token(self, *scopes, **kwargs):
+        await _latency()
+        return SimpleNamespace(token="stub-token", expires_on=0)
+
+
+class StubSecretClient(_AsyncClient):
+    def __init__(self, vault_url=None, credential=None, secrets=None):
+        self.secrets = secrets or {}
+
+    async def get_secret(self, name):
+        await _latency()
+        return SimpleNamespace(name=name, value=self.secrets.get(name, f"stub-{name}"))
+
+
+class _StubContainerGroups:
+    def __init__(self):
+        self.groups = {}
+
+    async def get(self, resource_group_name, container_group_name):
+        await _latency()
+        return self.groups.get(container_group_name) or SimpleNamespace(
+            name=container_group_name,
+            ip_address=SimpleNamespace(fqdn=f"{container_group_name}.local.stub"),
+        )
+
+    async def list_by_resource_group(self, resource_group_name):
+        await _latency()
+        for container_group in list(self.groups.values()):
+            yield container_group
+
+    async def begin_delete(self, resource_group_name, container_group_name):
+        await _latency()
+        self.groups.pop(container_group_name, None)
+        return _StubPoller(container_group_name)
+
+
+class StubContainerInstanceClient(_AsyncClient):
+    def __init__(self, credential=None, subscription_id=None):
+        self.container_groups = _StubContainerGroups()
+
+
+class _StubPoller:
+    def __init__(self, deployment_name):
+        self.deployment_name = deployment_name
+
+    async def result(self):
+        await _latency()
+        return SimpleNamespace(name=self.deployment_name,
+                               properties=SimpleNamespace(provisioning_state="Succeeded", error=None))
+
+
+class _StubDeployments:
+    def __init__(self):
+        self.submitted = []
+
+    async def begin_create_or_update(self, resource_group_name, deployment_name, parameters):
+        await _latency()
+        self.submitted.append((deployment_name, parameters))
+        return _StubPoller(deployment_name)
+
+
+class StubResourceClient(_AsyncClient):
+    def __init__(self, credential=None, subscription_id=None):
+        self.deployments = _StubDeployments()
+
+
+class FakeDeploymentBackend:
+    """
+    Stands in for dbt_sharding.ArmDeploymentBackend: every job "runs" for `run_seconds`
+    and then exits with the code from `exit_codes` (keyed by job name, default 0).
+    """
+
+    def __init__(self, run_seconds=None, exit_codes=None):
+        self.run_seconds = STUB_LATENCY_SECONDS if run_seconds is None else run_seconds
+        self.exit_codes = exit_codes or {}
+        self.deployed = {}  # job name -> (arm_parameters, deployed_at)
+
+    async def deploy(self, job_instance_name, arm_parameters):
+        await _latency()
+        self.deployed[job_instance_name] = (arm_parameters, asyncio.get_running_loop().time())
+        return "deployed"
+
+    async def get_exit_code(self, job_instance_name):
+        _, deployed_at = self.deployed[job_instance_name]
+        if asyncio.get_running_loop().time() - deployed_at < self.run_seconds:
+            return None
+        return self.exit_codes.get(job_instance_name, 0)
+
+    async def first_node_started_at(self, job_instance_name):
+        # The fake job "starts its first model" halfway through its run
+        return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.run_seconds / 2)
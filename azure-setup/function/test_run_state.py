@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import run_state
+
+LANDING = "model.woodcorps.landing_orders"
+
+
+@pytest.fixture
+def manifest():
+    def model(name, path, depends_on=()):
+        return {"name": name, "resource_type": "model", "package_name": "woodcorps", "original_file_path": path,
+                "database": "dev", "schema": "raw", "depends_on": {"nodes": list(depends_on), "macros": []}}
+
+    return {"metadata": {"project_name": "woodcorps"}, "macros": {}, "nodes": {
+        LANDING: model("landing_orders", "models/landing/landing_orders.sql"),
+        "model.woodcorps.stg_orders": model("stg_orders", "models/staging/stg_orders.sql", [LANDING]),
+        "seed.woodcorps.raw_orders": {**model("raw_orders", "seeds/raw_orders.csv"), "resource_type": "seed"},
+    }}
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "project" / "seeds").mkdir(parents=True)
+    (tmp_path / "project" / "seeds" / "raw_orders.csv").write_text("id\n1\n")
+    (tmp_path / "raw" / "raw_orders").mkdir(parents=True)
+    (tmp_path / "raw" / "raw_orders" / "part-00000.parquet").write_bytes(b"1")
+    return tmp_path
+
+
+def fingerprint(project, manifest, sources=None):
+    state = asyncio.run(run_state.fingerprint(run_state.LocalProjectSource(project / "project"), manifest,
+                                              raw_source=run_state.LocalRawDataSource(project / "raw")))
+    return {**state, "sources": sources or {}}
+
+
+def test_input_tables_include_landing_models(manifest):
+    assert run_state.input_tables(manifest) == {LANDING: "dev.raw.landing_orders"}
+
+
+def test_unchanged_inputs_skip(project, manifest):
+    previous = fingerprint(project, manifest)
+    assert run_state.plan_run(manifest, previous, fingerprint(project, manifest))[0] == "skip"
+
+
+def test_new_raw_file_runs_its_landing_model(project, manifest):
+    previous = fingerprint(project, manifest)
+    (project / "raw" / "raw_orders" / "part-00001.parquet").write_bytes(b"2")
+    assert run_state.plan_run(manifest, previous, fingerprint(project, manifest)) == ("select", "landing_orders+")
+
+
+def test_raw_data_without_landing_model_runs_everything(project, manifest):
+    previous = fingerprint(project, manifest)
+    (project / "raw" / "raw_customers").mkdir()
+    (project / "raw" / "raw_customers" / "part-00000.parquet").write_bytes(b"3")
+    assert run_state.plan_run(manifest, previous, fingerprint(project, manifest))[0] == "full"
+
+
+def test_landing_commit_runs_downstream_models(project, manifest):
+    previous = fingerprint(project, manifest, sources={LANDING: 3})
+    current = fingerprint(project, manifest, sources={LANDING: 4})
+    assert run_state.plan_run(manifest, previous, current) == ("select", "stg_orders+")
+
+
+def test_changed_seed_runs_the_seed(project, manifest):
+    previous = fingerprint(project, manifest)
+    (project / "project" / "seeds" / "raw_orders.csv").write_text("id\n1\n2\n")
+    assert run_state.plan_run(manifest, previous, fingerprint(project, manifest)) == ("select", "raw_orders+")
@@ -161,7 +161,9 @@ echo "Building and unity catalog image"
 #az acr build --registry $ACR_NAME --image uc-server:latest --file dockerfile.uc .
 
 echo "Building and  dbt image"
-#az acr build --registry $ACR_NAME --image dbt-server:latest --file dockerfile.dbt .
+# STORAGE_PATH must match the function's storage path for the baked dbt parse to be reused at runtime
+#az acr build --registry $ACR_NAME --image dbt-server:latest --file dockerfile.dbt \
+#    --build-arg STORAGE_PATH="abfss://${BLOB_CONTAINER_NAME}@${STORAGE_ACCT_NAME}.dfs.core.windows.net/delta-tables" .
 
 echo "Building and Pushing Permissions Manager Image."
 if [ ! -d "$PERMISSIONS_MANAGER_SRC_PATH" ]; then
@@ -363,6 +365,16 @@ if [ ! -f "$DBT_JOB_JSON_FILE_PATH" ]; then
     echo "ERROR: Compiled dbt job JSON file not found at '$DBT_JOB_JSON_FILE_PATH'. Check Step 7."
     exit 1
 fi
+# DBT_SHARD_JOBS and DBT_CHANGE_AWARE read dbt-project/target/manifest.json, which isn't in git, so build it here
+echo "Parsing the function's dbt project to ship its manifest..."
+if command -v dbt > /dev/null; then
+    (cd "$FUNCTION_CODE_FOLDER/dbt-project" && UC_ADMIN_TOKEN=build UC_ENDPOINT=http://localhost:8080 \
+        STORAGE_PATH="abfss://${BLOB_CONTAINER_NAME}@${STORAGE_ACCT_NAME}.dfs.core.windows.net/delta-tables" dbt parse)
+    if [ $? -ne 0 ]; then echo "ERROR: dbt parse failed for '$FUNCTION_CODE_FOLDER/dbt-project'."; exit 1; fi
+else
+    echo "WARNING: dbt is not installed, deploying without a dbt manifest. DBT_SHARD_JOBS falls back to a single job"
+    echo "         and DBT_CHANGE_AWARE runs the whole project on every change (pip install dbt-duckdb to fix)."
+fi
 ZIP_FILE_PATH="/tmp/${FUNCTION_APP_NAME}_code.zip"
 echo "Creating deployment package '$ZIP_FILE_PATH' from '$FUNCTION_CODE_FOLDER'..."
 (cd "$FUNCTION_CODE_FOLDER" && zip -r "$ZIP_FILE_PATH" ./* -x "*.pyc" ".venv/*" ".vscode/*" ".git/*")
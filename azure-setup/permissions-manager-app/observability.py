@@ -0,0 +1,58 @@
+import os
+import time
+import uuid
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Histogram
+
+TRACE_HEADER = "X-Trace-Id"
+UC_SLOW_CALL_SECONDS = float(os.environ.get("UC_SLOW_CALL_SECONDS", "1.0"))
+
+# Trace id of the request being handled; asyncio tasks created while handling it inherit it
+current_trace_id = ContextVar("trace_id", default=None)
+
+REQUEST_LATENCY = Histogram(
+    "uc_service_request_duration_seconds", "Latency of permissions service requests.",
+    ["method", "endpoint", "status"])
+UC_CALL_LATENCY = Histogram(
+    "uc_upstream_request_duration_seconds", "Latency of Unity Catalog API calls made by the service.",
+    ["operation"])
+UC_CALL_ERRORS = Counter(
+    "uc_upstream_errors_total", "Unity Catalog API calls that raised, by exception type.",
+    ["operation", "error"])
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def route_template(request):
+    """The matched route's path template (e.g. /grant/{stype}/...), so metrics labels stay low-cardinality."""
+    from starlette.routing import Match
+
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+async def uc_call(operation, method, **kwargs):
+    """
+    Calls a unitycatalog-client API method, recording its latency and errors under `operation`
+    and forwarding the current trace id to UC in the X-Trace-Id header.
+    """
+    trace_id = current_trace_id.get()
+    if trace_id:
+        kwargs["_headers"] = {**kwargs.get("_headers", {}), TRACE_HEADER: trace_id}
+    started = time.perf_counter()
+    try:
+        return await method(**kwargs)
+    except Exception as e:
+        UC_CALL_ERRORS.labels(operation, type(e).__name__).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        UC_CALL_LATENCY.labels(operation).observe(elapsed)
+        if elapsed >= UC_SLOW_CALL_SECONDS:
+            print(f"(Service) Slow UC call {operation}: {elapsed:.3f}s (trace {trace_id})")
@@ -0,0 +1,139 @@
+import time
+
+# Privileges a principal needs on each parent to use anything below it: USE CATALOG on the
+# catalog and USE SCHEMA (granted on the schema or its catalog) on the schema
+USAGE_PRIVILEGES = ("USE CATALOG", "USE SCHEMA")
+
+
+def ancestors(full_name):
+    """'cat.schema.table' -> ['cat', 'cat.schema', 'cat.schema.table']"""
+    parts = full_name.split(".")
+    return [".".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def assignments_to_dict(result):
+    """Converts a UC PermissionsList into {principal: frozenset(privilege names)}."""
+    grants = {}
+    for assignment in result.privilege_assignments or []:
+        privileges = frozenset(p.value for p in assignment.privileges or [])
+        if privileges:
+            grants[assignment.principal] = privileges
+    return grants
+
+
+class PermissionsIndex:
+    """
+    In-memory view of the catalog -> schema -> table tree and the direct grants on each node.
+    Privileges granted on a catalog or schema are inherited by everything below it, so the
+    granted privileges are the union of the direct grants along the securable's path. As in
+    Unity Catalog, they only take effect with USE CATALOG/USE SCHEMA on the parents.
+    Ownership, group membership and metastore admins aren't modelled.
+    """
+
+    def __init__(self):
+        self._types = {}      # full_name -> securable type
+        self._grants = {}     # full_name -> {principal: frozenset(privileges)}
+        self._children = {}   # full_name -> set(child full_names)
+        self.built_at = None
+        self.build_seconds = None
+        self.updates = 0
+        self._rebuild_updates = None  # full_name -> (stype, grants) updated while a rebuild is in flight
+
+    def begin_rebuild(self):
+        """
+        Starts recording update_securable() calls. A rebuild may have read a securable before a grant
+        or revoke refreshed it, so replace() re-applies the recorded updates over the rebuilt tree.
+        """
+        self._rebuild_updates = {}
+
+    def end_rebuild(self):
+        """Stops recording; called by replace() and when a rebuild fails."""
+        self._rebuild_updates = None
+
+    def replace(self, entries, build_seconds=None):
+        """Swaps in a freshly built tree; entries is [(stype, full_name, grants_dict)]."""
+        types, grants, children = {}, {}, {}
+        for stype, full_name, securable_grants in entries:
+            types[full_name] = stype
+            grants[full_name] = securable_grants
+            parent = full_name.rpartition(".")[0]
+            if parent:
+                children.setdefault(parent, set()).add(full_name)
+        self._types, self._grants, self._children = types, grants, children
+        for full_name, (stype, securable_grants) in (self._rebuild_updates or {}).items():
+            self._set(stype, full_name, securable_grants)
+        self.end_rebuild()
+        self.built_at = time.time()
+        self.build_seconds = build_seconds
+
+    def _set(self, stype, full_name, securable_grants):
+        self._types[full_name] = stype
+        self._grants[full_name] = securable_grants
+        parent = full_name.rpartition(".")[0]
+        if parent:
+            self._children.setdefault(parent, set()).add(full_name)
+
+    def update_securable(self, stype, full_name, securable_grants):
+        """Incrementally replaces the direct grants of one securable."""
+        self._set(stype, full_name, securable_grants)
+        if self._rebuild_updates is not None:
+            self._rebuild_updates[full_name] = (stype, securable_grants)
+        self.updates += 1
+
+    def __contains__(self, full_name):
+        return full_name in self._types
+
+    def missing_usage(self, principal, full_name):
+        """{parent_full_name: privilege} of the USE CATALOG/USE SCHEMA grants principal lacks to reach a securable."""
+        missing, granted = {}, set()
+        for node, required in zip(ancestors(full_name)[:-1], USAGE_PRIVILEGES):
+            granted |= self._grants.get(node, {}).get(principal, frozenset())
+            if required not in granted:
+                missing[node] = required
+        return missing
+
+    def effective_privileges(self, principal, full_name):
+        """
+        Returns ({privileges}, {source_full_name: [privileges]}) for principal on a securable. The
+        sources list every grant along the path; privileges is empty when usage is missing.
+        """
+        privileges, sources = set(), {}
+        for node in ancestors(full_name):
+            granted = self._grants.get(node, {}).get(principal)
+            if granted:
+                privileges |= granted
+                sources[node] = sorted(granted)
+        if self.missing_usage(principal, full_name):
+            privileges = set()
+        return privileges, sources
+
+    def principals_with(self, privilege, full_name):
+        """Reverse lookup: principals holding `privilege` on a securable, directly or inherited, with usage."""
+        privilege = privilege.upper()
+        principals = set()
+        for node in ancestors(full_name):
+            for principal, granted in self._grants.get(node, {}).items():
+                if privilege in granted:
+                    principals.add(principal)
+        return {principal for principal in principals if not self.missing_usage(principal, full_name)}
+
+    def principal_permissions(self, principal):
+        """Effective privileges of a principal on every securable in the index it has usage on."""
+        effective = {}
+        for full_name, grants in self._grants.items():
+            if principal in grants:
+                stack = [full_name]
+                while stack:
+                    node = stack.pop()
+                    effective.setdefault(node, set()).update(grants[principal])
+                    stack.extend(self._children.get(node, ()))
+        return {name: sorted(privs) for name, privs in sorted(effective.items())
+                if not self.missing_usage(principal, name)}
+
+    def stats(self):
+        return {
+            "securables": len(self._types),
+            "built_at": self.built_at,
+            "build_seconds": self.build_seconds,
+            "incremental_updates": self.updates,
+        }
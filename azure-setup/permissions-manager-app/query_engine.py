@@ -0,0 +1,197 @@
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+from deltalake import DeltaTable
+
+
+class QueryError(ValueError):
+    """The SQL was rejected (not a single read-only SELECT) or failed to run."""
+
+
+def sql_string(value):
+    """`value` as a DuckDB string literal; quotes are doubled so it can't end the literal early."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def uc_setup_statements(uc_endpoint, uc_token, catalogs, extension_repository):
+    """DuckDB statements that load the Delta/UC extensions and attach the Unity Catalog catalogs."""
+    statements = [
+        "INSTALL delta", "LOAD delta",
+        f"INSTALL uc_catalog FROM {sql_string(extension_repository)}", "LOAD uc_catalog",
+        f"CREATE SECRET uc_secret (TYPE UC, TOKEN {sql_string(uc_token)}, ENDPOINT {sql_string(uc_endpoint)})",
+    ]
+    statements += [f'ATTACH {sql_string(catalog)} AS "{catalog}" (TYPE UC_CATALOG)' for catalog in catalogs]
+    return statements
+
+
+def discover_local_tables(root):
+    """{'catalog.schema.table': path} for the Delta tables laid out as <root>/<catalog>/<schema>/<table>."""
+    root = Path(root)
+    tables = {}
+    for log_dir in root.glob("*/*/*/_delta_log"):
+        catalog, schema, table = log_dir.parent.relative_to(root).parts
+        # DuckDB identifiers are case-insensitive, so look tables up by lower-cased name
+        tables[f"{catalog}.{schema}.{table}".lower()] = str(log_dir.parent)
+    return tables
+
+
+def _walk(node, tables, ctes, table_functions):
+    if isinstance(node, dict):
+        if node.get("type") == "BASE_TABLE":
+            tables.append((node.get("catalog_name") or "", node.get("schema_name") or "", node["table_name"]))
+        elif node.get("type") == "TABLE_FUNCTION":
+            table_functions.append(node["function"].get("function_name"))
+        for entry in (node.get("cte_map") or {}).get("map", []):
+            ctes.add(entry["key"])
+        for value in node.values():
+            _walk(value, tables, ctes, table_functions)
+    elif isinstance(node, list):
+        for value in node:
+            _walk(value, tables, ctes, table_functions)
+
+
+class ConnectionPool:
+    """Fixed set of DuckDB cursors on one database, so extensions, secrets and attachments are set up once."""
+
+    def __init__(self, database, size):
+        self._connections = queue.Queue()
+        for _ in range(size):
+            self._connections.put(database.cursor())
+
+    @contextmanager
+    def connection(self, timeout=None):
+        try:
+            con = self._connections.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No DuckDB connection available.")
+        try:
+            yield con
+        finally:
+            self._connections.put(con)
+
+
+class QueryEngine:
+    """
+    Runs read-only SQL over Delta tables with a pool of pre-attached DuckDB connections.
+
+    In "uc" mode the catalogs are attached through the uc_catalog extension. In "local" mode
+    (testing against file-backed tables, e.g. docker-setup/docker_files/data) every table under
+    `local_root` is exposed as a catalog.schema.table view over the files of its current Delta
+    snapshot, and the view is refreshed when the table gets a new commit.
+
+    Once set up, the database is always locked down: file and network access is limited to
+    `allowed_directories` (plus `local_root`), and the configuration can't be changed by queries.
+    """
+
+    def __init__(self, pool_size=4, setup_statements=(), local_root=None, storage_options=None,
+                 connection_timeout=30.0, allowed_directories=None):
+        self.local_root = local_root
+        self.storage_options = storage_options
+        self.connection_timeout = connection_timeout
+        self._database = duckdb.connect()
+        for statement in setup_statements:
+            self._database.execute(statement)
+        self._delta_tables = {}    # location -> DeltaTable, refreshed incrementally
+        self._view_versions = {}   # local table name -> version its view was built from
+        self._lock = threading.Lock()
+        self.local_tables = {}
+        if local_root:
+            self.refresh_local_tables()
+            allowed_directories = [*(allowed_directories or []), os.path.abspath(local_root) + os.sep]
+        self._lock_down(allowed_directories or [])
+        self.pool = ConnectionPool(self._database, pool_size)
+
+    def _lock_down(self, allowed_directories):
+        # Blocks replacement scans (FROM '/etc/passwd'), read_* functions, ATTACH and COPY outside the
+        # allowed prefixes; lock_configuration keeps queries from switching it back on
+        self._database.execute("SET allowed_directories = ?", [list(allowed_directories)])
+        self._database.execute("SET enable_external_access = false")
+        self._database.execute("SET python_enable_replacements = false")
+        self._database.execute("SET lock_configuration = true")
+
+    def close(self):
+        self._database.close()
+
+    # --- Parsing ---
+    def referenced_tables(self, sql):
+        """
+        Validates that `sql` is a single SELECT and returns the tables it reads, as
+        'catalog.schema.table' (or shorter, when not fully qualified), excluding CTEs.
+        """
+        try:
+            statements = duckdb.extract_statements(sql)
+        except duckdb.Error as e:
+            raise QueryError(str(e))
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+            raise QueryError("Only a single SELECT statement is allowed.")
+        with self.pool.connection(self.connection_timeout) as con:
+            tree = json.loads(con.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0])
+        if tree.get("error"):
+            raise QueryError(tree.get("error_message", "Could not parse the query."))
+        tables, ctes, table_functions = [], set(), []
+        _walk(tree, tables, ctes, table_functions)
+        if table_functions:
+            # read_csv/read_parquet/... would give access to arbitrary files on the service host
+            raise QueryError(f"Table functions are not allowed: {', '.join(sorted(set(table_functions)))}")
+        return sorted({".".join(part for part in name if part) for name in tables
+                       if not (name[0] == name[1] == "" and name[2] in ctes)})
+
+    # --- Delta versions ---
+    def refresh_local_tables(self):
+        with self._lock:
+            self.local_tables = discover_local_tables(self.local_root)
+            for name in {name.rsplit(".", 1)[0] for name in self.local_tables}:
+                catalog, schema = name.split(".")
+                if not self._database.execute(
+                        "SELECT 1 FROM duckdb_databases() WHERE database_name = ?", [catalog]).fetchone():
+                    self._database.execute(f'ATTACH \':memory:\' AS "{catalog}"')
+                self._database.execute(f'CREATE SCHEMA IF NOT EXISTS "{catalog}"."{schema}"')
+
+    def local_locations(self, names):
+        """Storage paths of local tables, rescanning `local_root` once if a table is unknown."""
+        if any(name.lower() not in self.local_tables for name in names):
+            self.refresh_local_tables()
+        return {name: self.local_tables[name.lower()] for name in names if name.lower() in self.local_tables}
+
+    def table_versions(self, locations):
+        """{name: current Delta version} for {name: storage location}; reads only new log entries."""
+        versions = {}
+        with self._lock:
+            for name, location in locations.items():
+                table = self._delta_tables.get(location)
+                if table is None:
+                    table = self._delta_tables[location] = DeltaTable(location, storage_options=self.storage_options)
+                else:
+                    table.update_incremental()
+                versions[name] = table.version()
+                if self.local_root and self._view_versions.get(name.lower()) != versions[name]:
+                    self._refresh_local_view(name, table)
+        return versions
+
+    def _refresh_local_view(self, name, table):
+        files = table.file_uris()
+        if not files:
+            return
+        quoted_name = ".".join(f'"{part}"' for part in name.split("."))
+        self._database.execute(
+            f"CREATE OR REPLACE VIEW {quoted_name} AS SELECT * FROM read_parquet({files!r}, hive_partitioning = true)")
+        self._view_versions[name.lower()] = table.version()
+
+    # --- Execution ---
+    @contextmanager
+    def execute(self, sql, batch_size=100_000):
+        """Runs `sql` on a pooled connection and yields a pyarrow RecordBatchReader over the result."""
+        with self.pool.connection(self.connection_timeout) as con:
+            try:
+                reader = con.execute(sql).fetch_record_batch(batch_size)
+            except duckdb.Error as e:
+                raise QueryError(str(e))
+            try:
+                yield reader
+            finally:
+                reader.close()
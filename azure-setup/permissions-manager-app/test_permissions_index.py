@@ -0,0 +1,61 @@
+from permissions_index import PermissionsIndex
+
+READ = frozenset({"SELECT"})
+WRITE = frozenset({"SELECT", "MODIFY"})
+USAGE = frozenset({"USE CATALOG", "USE SCHEMA"})
+
+
+def test_updates_during_rebuild_survive_replace():
+    index = PermissionsIndex()
+    index.begin_rebuild()
+    # The rebuild read dev.raw.orders before a grant refreshed it
+    index.update_securable("table", "dev.raw.orders", {"alice": WRITE})
+    index.replace([("catalog", "dev", {"alice": USAGE}), ("schema", "dev.raw", {}),
+                   ("table", "dev.raw.orders", {"alice": READ})])
+    assert index.effective_privileges("alice", "dev.raw.orders")[0] == USAGE | WRITE
+
+
+def test_updates_after_replace_are_not_replayed():
+    index = PermissionsIndex()
+    index.begin_rebuild()
+    index.replace([("catalog", "dev", {"alice": USAGE}), ("table", "dev.raw.orders", {"alice": READ})])
+    index.update_securable("table", "dev.raw.orders", {"alice": WRITE})
+    index.begin_rebuild()
+    index.replace([("catalog", "dev", {"alice": USAGE}), ("table", "dev.raw.orders", {"alice": READ})])
+    assert index.effective_privileges("alice", "dev.raw.orders")[0] == USAGE | READ
+
+
+def test_failed_rebuild_stops_recording():
+    index = PermissionsIndex()
+    index.begin_rebuild()
+    index.update_securable("table", "dev.raw.orders", {"alice": WRITE})
+    index.end_rebuild()
+    index.replace([("catalog", "dev", {"alice": USAGE}), ("table", "dev.raw.orders", {"alice": READ})])
+    assert index.effective_privileges("alice", "dev.raw.orders")[0] == USAGE | READ
+
+
+def usage_index(catalog_grants, schema_grants):
+    index = PermissionsIndex()
+    index.replace([("catalog", "dev", catalog_grants), ("schema", "dev.raw", schema_grants),
+                   ("table", "dev.raw.orders", {})])
+    return index
+
+
+def test_privileges_need_use_catalog_and_use_schema():
+    # SELECT granted on the catalog, but bob lacks USE SCHEMA and carol lacks USE CATALOG
+    index = usage_index({"alice": USAGE | READ, "bob": frozenset({"USE CATALOG", "SELECT"}), "carol": READ},
+                        {"carol": frozenset({"USE SCHEMA"})})
+    assert index.effective_privileges("alice", "dev.raw.orders")[0] == USAGE | READ
+    privileges, sources = index.effective_privileges("bob", "dev.raw.orders")
+    assert privileges == set() and sources == {"dev": ["SELECT", "USE CATALOG"]}
+    assert index.missing_usage("bob", "dev.raw.orders") == {"dev.raw": "USE SCHEMA"}
+    assert index.missing_usage("carol", "dev.raw.orders") == {"dev": "USE CATALOG"}
+    assert index.principals_with("select", "dev.raw.orders") == {"alice"}
+    # A schema only needs USE CATALOG, so bob still sees dev.raw but not its tables
+    assert index.principal_permissions("bob") == {"dev": ["SELECT", "USE CATALOG"], "dev.raw": ["SELECT", "USE CATALOG"]}
+
+
+def test_use_schema_on_the_schema_is_enough():
+    index = usage_index({"alice": frozenset({"USE CATALOG"})}, {"alice": frozenset({"USE SCHEMA", "SELECT"})})
+    assert index.effective_privileges("alice", "dev.raw.orders")[0] == {"USE CATALOG", "USE SCHEMA", "SELECT"}
+    assert index.principals_with("SELECT", "dev.raw.orders") == {"alice"}
@@ -0,0 +1,73 @@
+import duckdb
+import pyarrow as pa
+import pytest
+from deltalake import write_deltalake
+
+from query_engine import QueryEngine, QueryError, sql_string, uc_setup_statements
+
+
+@pytest.fixture
+def engine(tmp_path):
+    write_deltalake(str(tmp_path / "data" / "dev" / "raw" / "orders"), pa.table({"id": [1, 2]}))
+    engine = QueryEngine(pool_size=2, local_root=str(tmp_path / "data"))
+    engine.table_versions(engine.local_locations(["dev.raw.orders"]))  # Creates the table's view
+    yield engine
+    engine.close()
+
+
+@pytest.fixture
+def host_file(tmp_path):
+    path = tmp_path / "secret.csv"
+    path.write_text("value\nsecret\n")
+    return str(path)
+
+
+def test_reads_local_table(engine):
+    names = engine.referenced_tables("SELECT * FROM dev.raw.orders")
+    assert engine.table_versions(engine.local_locations(names)) == {"dev.raw.orders": 0}
+    with engine.execute("SELECT * FROM dev.raw.orders") as reader:
+        assert reader.read_all().num_rows == 2
+
+
+@pytest.mark.parametrize("sql", ["SELECT * FROM '{path}'", "SELECT * FROM (FROM '{path}')"])
+def test_literal_path_is_not_a_known_table(engine, host_file, sql):
+    names = engine.referenced_tables(sql.format(path=host_file))
+    assert names == [host_file]
+    assert engine.local_locations(names) == {}
+
+
+@pytest.mark.parametrize("sql", ["SELECT * FROM '{path}'", "SELECT * FROM (FROM '{path}')",
+                                 "SELECT * FROM dev.raw.orders, '{path}'"])
+def test_literal_path_is_blocked_on_execution(engine, host_file, sql):
+    with pytest.raises(QueryError, match="Permission"):
+        with engine.execute(sql.format(path=host_file)) as reader:
+            reader.read_all()
+
+
+def test_configuration_is_locked(engine):
+    with pytest.raises(QueryError):
+        with engine.execute("SET enable_external_access = true"):
+            pass
+
+
+def test_table_functions_are_rejected(engine, host_file):
+    with pytest.raises(QueryError, match="Table functions"):
+        engine.referenced_tables(f"SELECT * FROM read_csv('{host_file}')")
+
+
+def test_engine_is_locked_down_without_allowed_directories(host_file):
+    engine = QueryEngine(pool_size=1)
+    try:
+        with pytest.raises(QueryError, match="Permission"):
+            with engine.execute(f"SELECT * FROM '{host_file}'") as reader:
+                reader.read_all()
+    finally:
+        engine.close()
+
+
+def test_setup_statements_quote_the_token():
+    token = "abc', ENDPOINT 'http://evil'); SELECT 1; --"
+    secret = next(s for s in uc_setup_statements("http://uc:8080", token, ["unity"], "http://repo")
+                  if s.startswith("CREATE SECRET"))
+    assert len(duckdb.extract_statements(secret)) == 1
+    assert duckdb.sql(f"SELECT {sql_string(token)}").fetchone()[0] == token
@@ -0,0 +1,29 @@
+from ttl_cache import TTLCache
+
+
+def test_set_after_invalidation_is_dropped():
+    cache = TTLCache()
+    generation = cache.generation("key")  # Read starts
+    cache.invalidate("key")               # Write lands while the read is in flight
+    assert cache.set("key", "before write", generation=generation) is False
+    assert cache.get("key") is None
+    assert cache.stats()["stale_sets"] == 1
+
+    generation = cache.generation("key")
+    assert cache.set("key", "after write", generation=generation) is True
+    assert cache.get("key") == "after write"
+
+
+def test_clear_drops_reads_in_flight():
+    cache = TTLCache()
+    generation = cache.generation("key")
+    cache.clear()
+    assert cache.set("key", "value", generation=generation) is False
+
+
+def test_other_keys_are_unaffected():
+    cache = TTLCache()
+    generation = cache.generation("a")
+    cache.invalidate("b")
+    assert cache.set("a", 1, generation=generation) is True
+    assert cache.set("b", 2) is True
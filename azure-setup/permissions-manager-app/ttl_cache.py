@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries expire `ttl` seconds after being set.
+
+    Every invalidation of a key bumps its generation. A reader takes `generation(key)` before fetching
+    and passes it to `set()`, which drops the value if the key was invalidated in the meantime, so a
+    fetch that started before a write can't put the pre-write value back after the write invalidated it.
+    """
+
+    def __init__(self, maxsize=256, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._generations = {}  # key -> number of invalidations; outlives the entries themselves
+        self._clears = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def generation(self, key):
+        return self._clears, self._generations.get(key, 0)
+
+    def set(self, key, value, generation=None):
+        """Stores value; returns False (and stores nothing) if `key` was invalidated since `generation`."""
+        if generation is not None and generation != self.generation(key):
+            self.stale_sets += 1
+            return False
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        return True
+
+    def invalidate(self, key):
+        self._generations[key] = self._generations.get(key, 0) + 1
+        if self._data.pop(key, _MISSING) is not _MISSING:
+            self.invalidations += 1
+
+    def clear(self):
+        self._clears += 1
+        self.invalidations += len(self._data)
+        self._data.clear()
+
+    def __contains__(self, key):
+        entry = self._data.get(key, _MISSING)
+        return entry is not _MISSING and entry[0] > time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "stale_sets": self.stale_sets,
+        }
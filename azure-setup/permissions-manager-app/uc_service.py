@@ -1,32 +1,152 @@
 import sys
 print(f"Python executable: {sys.executable}")
 
-from fastapi import FastAPI, HTTPException
+import io
+import json
+import os
+from contextlib import ExitStack, asynccontextmanager
+from typing import List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import pyarrow as pa
 from unitycatalog.client import ApiClient, Configuration
-from unitycatalog.client.api import catalogs_api, grants_api
+from unitycatalog.client.api import catalogs_api, grants_api, schemas_api, tables_api
 from unitycatalog.client.models import permissions_change, privilege, update_permissions
 from unitycatalog.client.models.securable_type import SecurableType
-from prettytable import PrettyTable
+from ttl_cache import TTLCache
+from permissions_index import PermissionsIndex, assignments_to_dict
+from query_engine import QueryEngine, QueryError, uc_setup_statements
+from observability import (TRACE_HEADER, REQUEST_LATENCY, current_trace_id, new_trace_id, route_template,
+                           uc_call)
 import asyncio
 import subprocess
+import time
 
 
-app = FastAPI()
+UC_HOST = os.environ.get("UC_HOST", "http://Localhost:8080/api/2.1/unity-catalog")
+UC_TOKEN_FILE = os.environ.get("UC_TOKEN_FILE", "/uc-config/conf/token.txt")
+UC_CONNECTION_POOL_SIZE = int(os.environ.get("UC_CONNECTION_POOL_SIZE", "10"))
+GRANTS_CACHE_TTL_SECONDS = float(os.environ.get("GRANTS_CACHE_TTL_SECONDS", "30"))
+GRANTS_CACHE_MAX_ENTRIES = int(os.environ.get("GRANTS_CACHE_MAX_ENTRIES", "1024"))
+UC_MAX_CONCURRENT_REQUESTS = int(os.environ.get("UC_MAX_CONCURRENT_REQUESTS", "8"))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "4"))  # Default and cap of a batch's max_concurrency
+PERMISSIONS_INDEX_REFRESH_SECONDS = float(os.environ.get("PERMISSIONS_INDEX_REFRESH_SECONDS", "600"))
+GRANTS_PAGE_MAX_LIMIT = int(os.environ.get("GRANTS_PAGE_MAX_LIMIT", "1000"))
+# Read-only SQL endpoint: "uc" attaches Unity Catalog, "local" serves the Delta tables under QUERY_LOCAL_ROOT
+QUERY_MODE = os.environ.get("QUERY_MODE", "uc").lower()  # "uc", "local" or "off"
+QUERY_LOCAL_ROOT = os.environ.get("QUERY_LOCAL_ROOT", "/data")
+QUERY_UC_CATALOGS = [c.strip() for c in os.environ.get("QUERY_UC_CATALOGS", "unity").split(",") if c.strip()]
+QUERY_EXTENSION_REPOSITORY = os.environ.get("QUERY_EXTENSION_REPOSITORY", "http://nightly-extensions.duckdb.org")
+QUERY_STORAGE_OPTIONS = os.environ.get("QUERY_STORAGE_OPTIONS")  # JSON, e.g. {"account_name": ..., "account_key": ...}
+# Storage prefixes the uc-mode engine may read, e.g. abfss://<container>@<account>.dfs.core.windows.net/
+QUERY_ALLOWED_DIRECTORIES = [d.strip() for d in os.environ.get("QUERY_ALLOWED_DIRECTORIES", "").split(",") if d.strip()]
+QUERY_POOL_SIZE = int(os.environ.get("QUERY_POOL_SIZE", "4"))
+QUERY_CACHE_TTL_SECONDS = float(os.environ.get("QUERY_CACHE_TTL_SECONDS", "300"))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "128"))
+QUERY_CACHE_MAX_ROWS = int(os.environ.get("QUERY_CACHE_MAX_ROWS", "100000"))
 
+# Token is cached and only re-read when the file's mtime changes
+_token_cache = {"mtime": None, "token": None}
 
-def ptable(result):
-    print_table = PrettyTable(['PRINCIPAL', 'PRIVILEGES'])
-    for assignment in result.privilege_assignments:
-        principal = assignment.principal
-        privileges = [p.value for p in assignment.privileges]
-        print_table.add_row([principal, str(privileges)])
-    return print_table
+# Grants read cache, keyed by (securable_type, full_name)
+grants_cache = TTLCache(maxsize=GRANTS_CACHE_MAX_ENTRIES, ttl=GRANTS_CACHE_TTL_SECONDS)
+
+# Query results, keyed by (normalized SQL, Delta versions of the tables read), and UC table locations
+query_cache = TTLCache(maxsize=QUERY_CACHE_MAX_ENTRIES, ttl=QUERY_CACHE_TTL_SECONDS)
+table_locations_cache = TTLCache(maxsize=1024, ttl=300)
+
+# Effective-permissions index over every catalog tree, rebuilt in the background
+permissions_index = PermissionsIndex()
+_background_tasks = set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared client (and connection pool) for the lifetime of the service
+    config = Configuration(host=UC_HOST)
+    config.connection_pool_maxsize = UC_CONNECTION_POOL_SIZE
+    token = get_admin_token()
+    app.state.api_client = ApiClient(configuration=config, header_name="Authorization", header_value=f"Bearer {token}")
+    print(f"(Service) Created UC ApiClient for {UC_HOST} (pool size {UC_CONNECTION_POOL_SIZE})")
+    index_task = asyncio.create_task(permissions_index_refresher())
+    app.state.query_engine = None
+    if QUERY_MODE != "off":
+        try:
+            # Extension install, secret and catalog attach happen once here, not per query
+            app.state.query_engine = await asyncio.to_thread(create_query_engine)
+            print(f"(Service) Query engine ready ({QUERY_MODE} mode, {QUERY_POOL_SIZE} connections)")
+        except Exception as e:
+            print(f"(Service) Query endpoint disabled, could not set up DuckDB: {e}")
+    try:
+        yield
+    finally:
+        index_task.cancel()
+        if app.state.query_engine is not None:
+            app.state.query_engine.close()
+        await app.state.api_client.close()
+        print("(Service) Closed UC ApiClient.")
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    # Reuse the caller's trace id (e.g. from the Streamlit app) so it follows the request into UC calls
+    trace_id = request.headers.get(TRACE_HEADER) or new_trace_id()
+    token = current_trace_id.set(trace_id)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        REQUEST_LATENCY.labels(request.method, route_template(request), str(status_code)).observe(
+            time.perf_counter() - started)
+        current_trace_id.reset(token)
+    response.headers[TRACE_HEADER] = trace_id
+    return response
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def grants_rows(result):
+    """Converts a UC PermissionsList into [{"principal", "privileges"}] rows."""
+    return [{"principal": assignment.principal, "privileges": sorted(p.value for p in assignment.privileges or [])}
+            for assignment in result.privilege_assignments or []]
+
+
+GRANTS_SORT_KEYS = {
+    "principal": lambda row: row["principal"].lower(),
+    "privilege_count": lambda row: (len(row["privileges"]), row["principal"].lower()),
+}
+
+
+def filter_and_sort_grants(rows, principal=None, privilege_name=None, sort="principal"):
+    """Filters rows by principal substring (case-insensitive) and exact privilege, then sorts ("-" = descending)."""
+    if principal:
+        principal = principal.lower()
+        rows = [row for row in rows if principal in row["principal"].lower()]
+    if privilege_name:
+        privilege_name = privilege_name.strip().upper()
+        rows = [row for row in rows if privilege_name in row["privileges"]]
+    return sorted(rows, key=GRANTS_SORT_KEYS[sort.lstrip("-")], reverse=sort.startswith("-"))
 
 
 def get_admin_token():
     try:
-        with open("/uc-config/conf/token.txt") as token_file:
-            return token_file.read().strip()
+        mtime = os.stat(UC_TOKEN_FILE).st_mtime
+        if mtime == _token_cache["mtime"]:
+            return _token_cache["token"]
+        with open(UC_TOKEN_FILE) as token_file:
+            token = token_file.read().strip()
+        _token_cache["mtime"], _token_cache["token"] = mtime, token
+        return token
     except FileNotFoundError:
         print("Token file not found!")
         return None
@@ -35,27 +155,218 @@ def get_admin_token():
         return None
 
 
-
 def get_api_client():
-    token = get_admin_token()
-    auth_header = f"Bearer {token}"
-    config = Configuration(host="http://Localhost:8080/api/2.1/unity-catalog")
-    api_client = ApiClient(configuration=config, header_name="Authorization", header_value=auth_header)
+    # Reuse the shared client, refreshing the auth header if the token file changed
+    api_client = app.state.api_client
+    api_client.set_default_header("Authorization", f"Bearer {get_admin_token()}")
     return api_client
 
 
+def grants_cache_key(stype, securable_full_name):
+    return (stype.lower(), securable_full_name)
+
+
+async def fetch_grants(stype, securable_full_name):
+    """Reads the grants on a securable from UC, bypassing the read cache."""
+    grant_client = grants_api.GrantsApi(get_api_client())
+    return await uc_call("grants.get", grant_client.get, securable_type=stype.lower(), full_name=securable_full_name)
+
+
+async def get_grants(stype, securable_full_name):
+    """Returns the grants on a securable, served from the read cache when fresh."""
+    key = grants_cache_key(stype, securable_full_name)
+    result = grants_cache.get(key)
+    if result is None:
+        # A grant/revoke that lands while this read is in flight invalidates the key; don't cache the older result
+        generation = grants_cache.generation(key)
+        result = await fetch_grants(stype, securable_full_name)
+        grants_cache.set(key, result, generation=generation)
+    return result
+
+
+async def list_catalog_tree(catalog_name):
+    """Returns [(securable_type, full_name)] for a catalog and all its schemas and tables."""
+    api_client = get_api_client()
+    schema_client = schemas_api.SchemasApi(api_client)
+    table_client = tables_api.TablesApi(api_client)
+
+    securables = [("catalog", catalog_name)]
+    schema_names = []
+    page_token = None
+    while True:
+        response = await uc_call("schemas.list", schema_client.list_schemas,
+                                  catalog_name=catalog_name, page_token=page_token)
+        for schema in response.schemas or []:
+            schema_names.append(schema.name)
+            securables.append(("schema", f"{catalog_name}.{schema.name}"))
+        page_token = response.next_page_token
+        if not page_token:
+            break
+
+    for schema_name in schema_names:
+        page_token = None
+        while True:
+            response = await uc_call(
+                "tables.list", table_client.list_tables,
+                catalog_name=catalog_name, schema_name=schema_name, page_token=page_token)
+            for table in response.tables or []:
+                securables.append(("table", f"{catalog_name}.{schema_name}.{table.name}"))
+            page_token = response.next_page_token
+            if not page_token:
+                break
+    return securables
+
+
+async def get_grants_many(securables, cached=True):
+    """
+    Fetches grants for many securables, resolving cache misses concurrently. With cached=False every
+    securable is read from UC and the read cache is left alone, so a full index rebuild doesn't evict hot entries.
+    """
+    semaphore = asyncio.Semaphore(UC_MAX_CONCURRENT_REQUESTS)
+    fetch_one = get_grants if cached else fetch_grants
+
+    async def fetch(stype, full_name):
+        async with semaphore:
+            return await fetch_one(stype, full_name)
+
+    results = await asyncio.gather(*(fetch(stype, name) for stype, name in securables), return_exceptions=True)
+    return list(zip(securables, results))
+
+
+async def list_catalog_names():
+    catalog_client = catalogs_api.CatalogsApi(get_api_client())
+    names, page_token = [], None
+    while True:
+        response = await uc_call("catalogs.list", catalog_client.list_catalogs, page_token=page_token)
+        names.extend(catalog.name for catalog in response.catalogs or [])
+        page_token = response.next_page_token
+        if not page_token:
+            break
+    return names
+
+
+async def build_permissions_index():
+    started = time.perf_counter()
+    # Grants/revokes refreshing entries while this runs are re-applied over the rebuilt tree
+    permissions_index.begin_rebuild()
+    try:
+        securables = []
+        for catalog_name in await list_catalog_names():
+            securables.extend(await list_catalog_tree(catalog_name))
+        entries = []
+        for (stype, full_name), result in await get_grants_many(securables, cached=False):
+            if isinstance(result, Exception):
+                print(f"(Service) Skipping {stype} {full_name} in permissions index: {result}")
+                continue
+            entries.append((stype, full_name, assignments_to_dict(result)))
+        permissions_index.replace(entries, build_seconds=time.perf_counter() - started)
+    finally:
+        permissions_index.end_rebuild()
+    print(f"(Service) Permissions index built: {len(entries)} securables in {permissions_index.build_seconds:.2f}s")
+
+
+async def permissions_index_refresher():
+    while True:
+        try:
+            await build_permissions_index()
+        except Exception as e:
+            print(f"(Service) Error building permissions index: {e}")
+        await asyncio.sleep(PERMISSIONS_INDEX_REFRESH_SECONDS)
+
+
+async def refresh_index_entry(stype, securable_full_name):
+    key = grants_cache_key(stype, securable_full_name)
+    generation = grants_cache.generation(key)
+    try:
+        result = await get_grants(stype, securable_full_name)
+        if grants_cache.generation(key) != generation:
+            return  # A later grant/revoke scheduled its own refresh; don't let this older read overwrite it
+        permissions_index.update_securable(stype.lower(), securable_full_name, assignments_to_dict(result))
+    except Exception as e:
+        print(f"(Service) Error refreshing permissions index for {securable_full_name}: {e}")
+
+
+def schedule_index_refresh(stype, securable_full_name):
+    # Runs after the response is sent; keep a reference so the task isn't garbage collected
+    task = asyncio.create_task(refresh_index_entry(stype, securable_full_name))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
 @app.get("/list_grants/{stype}/{securable_full_name}")
-async def list_grants_endpoint(stype: str, securable_full_name: str):
+async def list_grants_endpoint(
+        stype: str,
+        securable_full_name: str,
+        principal: Optional[str] = None,
+        privilege_name: Optional[str] = Query(None, alias="privilege"),
+        sort: Literal["principal", "-principal", "privilege_count", "-privilege_count"] = "principal",
+        offset: int = Query(0, ge=0),
+        limit: int = Query(100, ge=1, le=GRANTS_PAGE_MAX_LIMIT)):
     try:
-        api_client = get_api_client()
-        grant_client = grants_api.GrantsApi(api_client)
-        result = await grant_client.get(securable_type=stype, full_name=securable_full_name)
-        table = ptable(result)
-        return {"table": table.get_string()}
+        result = await get_grants(stype, securable_full_name)
+        rows = filter_and_sort_grants(grants_rows(result), principal, privilege_name, sort)
+        return {"securable_type": stype.lower(), "full_name": securable_full_name, "total": len(rows),
+                "offset": offset, "limit": limit, "grants": rows[offset:offset + limit]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/list_grants_tree/{catalog_name}")
+async def list_grants_tree_endpoint(catalog_name: str):
+    try:
+        securables = await list_catalog_tree(catalog_name)
+        tree = []
+        for (stype, full_name), result in await get_grants_many(securables):
+            if isinstance(result, Exception):
+                tree.append({"type": stype, "full_name": full_name, "error": str(result)})
+            else:
+                tree.append({"type": stype, "full_name": full_name, "grants": grants_rows(result)})
+        return {"securables": tree}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/cache_stats")
+async def cache_stats_endpoint():
+    return {"grants_cache": grants_cache.stats(), "permissions_index": permissions_index.stats(),
+            "query_cache": query_cache.stats()}
+
+
+def require_index_entry(securable_full_name):
+    if permissions_index.built_at is None:
+        raise HTTPException(status_code=503, detail="Permissions index is still being built.")
+    if securable_full_name not in permissions_index:
+        raise HTTPException(status_code=404, detail=f"Securable not found in permissions index: {securable_full_name}")
+
+
+@app.get("/effective_permissions/{principal}/{securable_full_name}")
+async def effective_permissions_endpoint(principal: str, securable_full_name: str):
+    """
+    Privileges the principal can use on the securable: its direct and inherited grants, or none while
+    it lacks USE CATALOG/USE SCHEMA on a parent (listed in missing_usage). granted_on lists every grant.
+    """
+    require_index_entry(securable_full_name)
+    privileges, sources = permissions_index.effective_privileges(principal, securable_full_name)
+    return {"principal": principal, "securable": securable_full_name,
+            "privileges": sorted(privileges), "granted_on": sources,
+            "missing_usage": permissions_index.missing_usage(principal, securable_full_name)}
+
+
+@app.get("/principals_with/{privilege_name}/{securable_full_name}")
+async def principals_with_endpoint(privilege_name: str, securable_full_name: str):
+    """Principals that hold the privilege on the securable, directly or inherited, and have usage on its parents."""
+    require_index_entry(securable_full_name)
+    principals = permissions_index.principals_with(privilege_name, securable_full_name)
+    return {"privilege": privilege_name.upper(), "securable": securable_full_name, "principals": sorted(principals)}
+
+
+@app.get("/principal_permissions/{principal}")
+async def principal_permissions_endpoint(principal: str):
+    if permissions_index.built_at is None:
+        raise HTTPException(status_code=503, detail="Permissions index is still being built.")
+    return {"principal": principal, "securables": permissions_index.principal_permissions(principal)}
+
+
 @app.get("/grant/{stype}/{securable_full_name}/{principal}/{permissions_str}")
 async def grant_endpoint(stype: str, securable_full_name: str, principal: str, permissions_str: str):
     try:
@@ -84,10 +395,13 @@ async def grant_endpoint(stype: str, securable_full_name: str, principal: str, p
         else:
             raise ValueError(f"Unsupported securable type: {stype}")
 
-        await grant_client.update(
+        await uc_call(
+            "grants.update", grant_client.update,
             securable_type=securable_type_enum,
             full_name=securable_full_name,
             update_permissions=permission_updates)
+        grants_cache.invalidate(grants_cache_key(stype, securable_full_name))
+        schedule_index_refresh(stype, securable_full_name)
 
         return {"message": "Permissions Granted"}
 
@@ -98,7 +412,7 @@ async def grant_endpoint(stype: str, securable_full_name: str, principal: str, p
 # --- REVOKE ENDPOINT ---
 @app.get("/revoke/{stype}/{securable_full_name}/{principal}/{permissions_str}")
 async def revoke_endpoint(stype: str, securable_full_name: str, principal: str, permissions_str: str):
-    print(f"(Service) Received revoke request: type={stype}, name={securable_full_name}, principal={principal}, perms={permissions_str}") # Added log
+    print(f"(Service) Received revoke request: type={stype}, name={securable_full_name}, principal={principal}, perms={permissions_str}, trace={current_trace_id.get()}") # Added log
     try:
         api_client = get_api_client()
         grant_client = grants_api.GrantsApi(api_client)
@@ -129,14 +443,260 @@ async def revoke_endpoint(stype: str, securable_full_name: str, principal: str,
         except KeyError:
              raise HTTPException(status_code=400, detail=f"Invalid securable type: {stype}")
 
-        await grant_client.update(
+        await uc_call(
+            "grants.update", grant_client.update,
             securable_type=securable_type_enum,
             full_name=securable_full_name,
             update_permissions=permission_updates)
+        grants_cache.invalidate(grants_cache_key(stype, securable_full_name))
+        schedule_index_refresh(stype, securable_full_name)
 
         print("(Service) Successfully revoked permissions.") # Added log
         return {"message": "Permissions Revoked"}
 
     except Exception as e:
         print(f"(Service) Error in revoke_endpoint: {e}") # Added log
-        raise HTTPException(status_code=500, detail=f"Failed to revoke permissions: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to revoke permissions: {str(e)}")
+
+
+# --- BATCH ENDPOINT ---
+class PermissionChangeItem(BaseModel):
+    action: str  # "grant" or "revoke"
+    securable_type: str
+    full_name: str
+    principal: str
+    privileges: List[str]
+
+
+class BatchPermissionsRequest(BaseModel):
+    changes: List[PermissionChangeItem]
+    max_concurrency: Optional[int] = None
+
+
+def parse_privileges(permissions):
+    """Maps privilege names to Privilege enums, returning (enums, invalid_names)."""
+    privilege_enums, invalid_perms = [], []
+    for perm in permissions:
+        perm_clean = perm.strip().upper()
+        if not perm_clean: continue
+        try:
+            privilege_enums.append(getattr(privilege.Privilege, perm_clean))
+        except AttributeError:
+            invalid_perms.append(perm)
+    return privilege_enums, invalid_perms
+
+
+def group_batch_changes(changes):
+    """
+    Validates batch items and groups them per securable.
+    Returns ({(stype, full_name): {principal: {"add": [...], "remove": [...], "items": [...]}}}, results)
+    where results already holds an error entry for every rejected item. UC applies a securable's
+    adds and removes as one update, so an item granting a privilege an earlier item revokes for
+    the same principal and securable (or the other way round) is rejected.
+    """
+    groups = {}
+    results = [None] * len(changes)
+    for index, item in enumerate(changes):
+        action = item.action.strip().lower()
+        if action not in ("grant", "revoke"):
+            results[index] = {"index": index, "status": "error", "detail": f"Invalid action: {item.action}"}
+            continue
+        if item.securable_type.upper() not in SecurableType.__members__:
+            results[index] = {"index": index, "status": "error", "detail": f"Invalid securable type: {item.securable_type}"}
+            continue
+        privilege_enums, invalid_perms = parse_privileges(item.privileges)
+        if invalid_perms or not privilege_enums:
+            detail = f"Invalid privilege(s): {', '.join(invalid_perms)}" if invalid_perms else "No privileges provided."
+            results[index] = {"index": index, "status": "error", "detail": detail}
+            continue
+
+        securable = grants_cache_key(item.securable_type, item.full_name)
+        existing = groups.get(securable, {}).get(item.principal)
+        opposite = (existing["remove"] if action == "grant" else existing["add"]) if existing else []
+        conflicts = [p.value for p in privilege_enums if p in opposite]
+        if conflicts:
+            earlier = "revokes" if action == "grant" else "grants"
+            results[index] = {"index": index, "status": "error",
+                              "detail": f"An earlier item in the batch {earlier} {', '.join(conflicts)} for "
+                                        f"{item.principal} on {item.full_name}; send them in separate batches."}
+            continue
+        change = groups.setdefault(securable, {}).setdefault(
+            item.principal, {"add": [], "remove": [], "items": []})
+        target = change["add"] if action == "grant" else change["remove"]
+        target.extend(p for p in privilege_enums if p not in target)
+        change["items"].append(index)
+    return groups, results
+
+
+async def apply_securable_changes(grant_client, securable, principal_changes):
+    stype, full_name = securable
+    permission_updates = update_permissions.UpdatePermissions(changes=[
+        permissions_change.PermissionsChange(principal=principal, add=change["add"], remove=change["remove"])
+        for principal, change in principal_changes.items()
+    ])
+    await uc_call(
+        "grants.update", grant_client.update,
+        securable_type=SecurableType[stype.upper()],
+        full_name=full_name,
+        update_permissions=permission_updates)
+    grants_cache.invalidate(securable)
+    schedule_index_refresh(stype, full_name)
+
+
+@app.post("/permissions/batch")
+async def batch_permissions_endpoint(request: BatchPermissionsRequest):
+    print(f"(Service) Received batch request with {len(request.changes)} change(s), trace={current_trace_id.get()}")
+    try:
+        groups, results = group_batch_changes(request.changes)
+        grant_client = grants_api.GrantsApi(get_api_client())
+        max_concurrency = min(max(1, request.max_concurrency or BATCH_MAX_CONCURRENCY), BATCH_MAX_CONCURRENCY)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def apply(securable, principal_changes):
+            async with semaphore:
+                await apply_securable_changes(grant_client, securable, principal_changes)
+
+        securables = list(groups.items())
+        outcomes = await asyncio.gather(*(apply(s, c) for s, c in securables), return_exceptions=True)
+
+        for (securable, principal_changes), outcome in zip(securables, outcomes):
+            for change in principal_changes.values():
+                for index in change["items"]:
+                    if isinstance(outcome, Exception):
+                        results[index] = {"index": index, "status": "error", "detail": str(outcome)}
+                    else:
+                        results[index] = {"index": index, "status": "ok"}
+
+        failed = sum(1 for r in results if r["status"] != "ok")
+        print(f"(Service) Batch applied to {len(securables)} securable(s), {failed} item(s) failed")
+        return {"results": results, "securables": len(securables), "failed": failed}
+    except Exception as e:
+        print(f"(Service) Error in batch_permissions_endpoint: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to apply batch: {str(e)}")
+
+
+# --- QUERY ENDPOINT ---
+class QueryRequest(BaseModel):
+    sql: str
+    format: Literal["ndjson", "arrow"] = "ndjson"
+    use_cache: bool = True
+
+
+def create_query_engine():
+    if QUERY_MODE == "local":
+        return QueryEngine(pool_size=QUERY_POOL_SIZE, local_root=QUERY_LOCAL_ROOT)
+    uc_endpoint = UC_HOST.split("/api/")[0]
+    if not QUERY_ALLOWED_DIRECTORIES:
+        print("(Service) QUERY_ALLOWED_DIRECTORIES is not set, so DuckDB can only reach the UC endpoint; "
+              "set it to the storage prefixes of the catalog tables to query them.")
+    return QueryEngine(
+        pool_size=QUERY_POOL_SIZE,
+        setup_statements=uc_setup_statements(uc_endpoint, get_admin_token() or "", QUERY_UC_CATALOGS,
+                                             QUERY_EXTENSION_REPOSITORY),
+        storage_options=json.loads(QUERY_STORAGE_OPTIONS) if QUERY_STORAGE_OPTIONS else None,
+        allowed_directories=[uc_endpoint + "/", *QUERY_ALLOWED_DIRECTORIES])
+
+
+async def resolve_table_locations(engine, names):
+    """
+    {name: storage location} for the tables a query reads; unknown tables are left out. In uc mode
+    only fully qualified catalog.schema.table names with a UC storage location resolve.
+    """
+    if engine.local_root:
+        return await asyncio.to_thread(engine.local_locations, names)
+    table_client = tables_api.TablesApi(get_api_client())
+    locations = {}
+    for name in names:
+        location = table_locations_cache.get(name)
+        if location is None and name.count(".") == 2:
+            try:
+                table = await uc_call("tables.get", table_client.get_table, full_name=name)
+                location = table.storage_location
+                table_locations_cache.set(name, location)
+            except Exception as e:
+                print(f"(Service) Could not resolve storage location of {name}: {e}")
+        if location:
+            locations[name] = location
+    return locations
+
+
+def serialize_batches(batches, schema, result_format):
+    if result_format == "arrow":
+        buffer = io.BytesIO()
+        with pa.ipc.new_stream(buffer, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()  # End-of-stream marker
+    else:
+        for batch in batches:
+            yield "".join(json.dumps(row, default=str) + "\n" for row in batch.to_pylist()).encode()
+
+
+def stream_query_result(stack, reader, cache_key):
+    """Yields result batches, releasing the pooled connection at the end and caching small results."""
+    cached_batches, rows = [], 0
+    try:
+        for batch in reader:
+            if cached_batches is not None:
+                rows += batch.num_rows
+                if rows <= QUERY_CACHE_MAX_ROWS:
+                    cached_batches.append(batch)
+                else:
+                    cached_batches = None
+            yield batch
+        if cache_key is not None and cached_batches is not None:
+            query_cache.set(cache_key, (reader.schema, cached_batches))
+    finally:
+        stack.close()
+
+
+@app.post("/query")
+async def query_endpoint(request: QueryRequest):
+    engine = app.state.query_engine
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Query engine is not available.")
+    try:
+        names = await asyncio.to_thread(engine.referenced_tables, request.sql)
+        locations = await resolve_table_locations(engine, names)
+        unresolved = sorted(set(names) - set(locations))
+        if unresolved:
+            # Also rejects replacement scans such as FROM '/etc/passwd', which parse as table names
+            raise QueryError(f"Unknown tables (use catalog.schema.table): {', '.join(unresolved)}")
+        versions = await asyncio.to_thread(engine.table_versions, locations)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    # Every table read is a known Delta table, so a new commit to any of them changes the key
+    cache_key = None
+    if request.use_cache and names:
+        # The exact SQL: normalizing whitespace would also change string literals in it
+        cache_key = (request.sql, tuple(sorted(versions.items())))
+    media_type = "application/vnd.apache.arrow.stream" if request.format == "arrow" else "application/x-ndjson"
+    headers = {"X-Delta-Versions": json.dumps(versions), "X-Query-Cache": "bypass" if cache_key is None else "miss"}
+
+    cached = query_cache.get(cache_key) if cache_key is not None else None
+    if cached is not None:
+        schema, batches = cached
+        headers["X-Query-Cache"] = "hit"
+        return StreamingResponse(serialize_batches(batches, schema, request.format), media_type=media_type,
+                                 headers=headers)
+
+    # Run the query in a worker thread; the connection stays checked out until the result is streamed
+    stack = ExitStack()
+    try:
+        reader = await asyncio.to_thread(stack.enter_context, engine.execute(request.sql))
+    except QueryError as e:
+        stack.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except TimeoutError as e:
+        stack.close()
+        raise HTTPException(status_code=503, detail=str(e))
+    # Starlette iterates this sync generator in its thread pool, so fetching batches doesn't block the loop
+    return StreamingResponse(
+        serialize_batches(stream_query_result(stack, reader, cache_key), reader.schema, request.format),
+        media_type=media_type, headers=headers)
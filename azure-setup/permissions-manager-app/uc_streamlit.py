@@ -1,18 +1,46 @@
+import csv
+import io
+import re
+import uuid
 import streamlit as st
 import requests
 
 # Constants - Replace with your service URL
 BASE_URL = "http://localhost:8000"  # Default FastAPI port
 
-# --- Helper Function to make API calls ---
-def make_api_call(endpoint_url):
-    """Makes a GET request and handles common errors."""
+REQUEST_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+TRACE_HEADER = "X-Trace-Id"  # Followed by the service into its Unity Catalog calls
+GRANTS_CACHE_TTL_SECONDS = 30
+
+# --- Helper Functions to make API calls ---
+@st.cache_resource
+def get_session():
+    """One requests.Session (and connection pool) shared by every rerun and user of the app."""
+    return requests.Session()
+
+
+def _request(method, endpoint_url, payload=None, params=None):
+    trace_id = uuid.uuid4().hex
+    print(f"(Streamlit) Calling: {method} {endpoint_url} {params or ''} trace={trace_id}") # Log the call
+    response = get_session().request(method, endpoint_url, json=payload, params=params, timeout=REQUEST_TIMEOUT,
+                                     headers={TRACE_HEADER: trace_id})
+    response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+    print(f"(Streamlit) Response Status: {response.status_code}") # Log success status
+    return response.json()
+
+
+@st.cache_data(ttl=GRANTS_CACHE_TTL_SECONDS, show_spinner=False)
+def _cached_get(endpoint_url, params=None):
+    # Exceptions are not cached, so failed calls are retried on the next rerun
+    return _request("GET", endpoint_url, params=params)
+
+
+def make_api_call(endpoint_url, method="GET", payload=None, params=None, cached=False):
+    """Makes a GET (or POST with a JSON payload) request and handles common errors."""
     try:
-        print(f"(Streamlit) Calling: {endpoint_url}") # Log the call
-        response = requests.get(endpoint_url)
-        response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-        print(f"(Streamlit) Response Status: {response.status_code}") # Log success status
-        return response.json()
+        if cached:
+            return _cached_get(endpoint_url, params)
+        return _request(method, endpoint_url, payload=payload, params=params)
     except requests.exceptions.ConnectionError:
         st.error(f"Connection Error: Could not connect to the service at {BASE_URL}. Is the service running?")
         return None
@@ -26,7 +54,8 @@ def make_api_call(endpoint_url):
             detail = e.response.json().get('detail', detail)
         except requests.exceptions.JSONDecodeError:
             pass # Keep raw text if JSON parsing fails
-        st.error(f"Service Error ({e.response.status_code}): {detail}")
+        st.error(f"Service Error ({e.response.status_code}): {detail} "
+                 f"(trace id: {e.response.headers.get(TRACE_HEADER, 'n/a')})")
         return None
     except requests.exceptions.RequestException as e:
         st.error(f"An unexpected request error occurred: {e}")
@@ -35,6 +64,11 @@ def make_api_call(endpoint_url):
         st.error(f"An unexpected error occurred in Streamlit: {e}")
         return None
 
+
+def invalidate_cached_reads():
+    # Grants changed, so listings cached before the change are stale
+    _cached_get.clear()
+
 # Streamlit app
 st.title("Unity Catalog Permissions Manager")
 
@@ -46,18 +80,42 @@ with list_cols[0]:
 with list_cols[1]:
     securable_full_name_list = st.text_input("Securable Full Name", key="list_name", placeholder="e.g., unity or unity.default")
 
+filter_cols = st.columns(4)
+with filter_cols[0]:
+    principal_filter = st.text_input("Principal contains", key="list_principal_filter")
+with filter_cols[1]:
+    privilege_filter = st.text_input("Has privilege", key="list_privilege_filter", placeholder="e.g., SELECT")
+with filter_cols[2]:
+    sort_list = st.selectbox("Sort by", ["principal", "-principal", "privilege_count", "-privilege_count"], key="list_sort")
+with filter_cols[3]:
+    page_size = st.selectbox("Page size", [50, 100, 500, 1000], index=1, key="list_page_size")
+
 list_button = st.button("List Permissions", key="list_button")
 
 if list_button:
     if not securable_full_name_list:
         st.warning("Please enter the Securable Full Name.")
     else:
-        endpoint = f"{BASE_URL}/list_grants/{stype_list}/{securable_full_name_list}"
-        data = make_api_call(endpoint)
-        if data and "table" in data:
-            # Use st.text to display preformatted table string from PrettyTable
-            st.text(data["table"])
-        # Error handling is done within make_api_call
+        # Kept in session state so paging and filtering rerun the listing without another click
+        st.session_state["list_target"] = (stype_list, securable_full_name_list)
+        st.session_state["list_page"] = 1
+
+if "list_target" in st.session_state:
+    listed_stype, listed_name = st.session_state["list_target"]
+    page = st.number_input("Page", min_value=1, step=1, key="list_page")
+    params = {"sort": sort_list, "offset": (page - 1) * page_size, "limit": page_size}
+    if principal_filter:
+        params["principal"] = principal_filter.strip()
+    if privilege_filter:
+        params["privilege"] = privilege_filter.strip().upper()
+    data = make_api_call(f"{BASE_URL}/list_grants/{listed_stype}/{listed_name}", params=params, cached=True)
+    if data and "grants" in data:
+        first = data["offset"] + 1 if data["grants"] else 0
+        st.caption(f"{listed_stype} {listed_name}: principals {first}-{data['offset'] + len(data['grants'])} "
+                   f"of {data['total']}")
+        st.dataframe([{"principal": g["principal"], "privileges": ", ".join(g["privileges"])} for g in data["grants"]],
+                     use_container_width=True)
+    # Error handling is done within make_api_call
 
 # ------------------ Grant Permissions UI ------------------
 st.header("Grant Permissions")
@@ -83,6 +141,7 @@ if grant_button:
             endpoint = f"{BASE_URL}/grant/{stype_grant}/{securable_full_name_grant}/{principal_grant}/{permissions_str_grant}"
             data = make_api_call(endpoint)
             if data and "message" in data:
+                invalidate_cached_reads()
                 st.success(data["message"])
             # Error handling is done within make_api_call
 
@@ -110,5 +169,44 @@ if revoke_button:
             endpoint = f"{BASE_URL}/revoke/{stype_revoke}/{securable_full_name_revoke}/{principal_revoke}/{permissions_str_revoke}"
             data = make_api_call(endpoint)
             if data and "message" in data:
+                invalidate_cached_reads()
                 st.success(data["message"])
-            # Error handling is done within make_api_call
\ No newline at end of file
+            # Error handling is done within make_api_call
+
+# ------------------ Bulk Permissions UI ------------------
+st.header("Bulk Grant/Revoke (CSV)")
+st.caption("CSV columns: action (grant/revoke), securable_type, full_name, principal, privileges "
+           "(separated by ';' or quoted and comma-separated)")
+
+bulk_file = st.file_uploader("Permissions CSV", type=["csv"], key="bulk_file")
+bulk_concurrency = st.number_input("Max concurrent securable updates", min_value=1, max_value=32, value=4, key="bulk_concurrency",
+                                   help="Capped by the service's BATCH_MAX_CONCURRENCY")
+
+if bulk_file is not None:
+    reader = csv.DictReader(io.StringIO(bulk_file.getvalue().decode("utf-8")))
+    bulk_changes = []
+    for row in reader:
+        row = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+        bulk_changes.append({
+            "action": row.get("action", ""),
+            "securable_type": row.get("securable_type", ""),
+            "full_name": row.get("full_name", ""),
+            "principal": row.get("principal", ""),
+            "privileges": [p.strip().upper() for p in re.split(r"[;,]", row.get("privileges", "")) if p.strip()],
+        })
+    st.dataframe(bulk_changes)
+
+    if st.button("Apply Bulk Changes", key="bulk_button"):
+        if not bulk_changes:
+            st.warning("The uploaded CSV has no rows.")
+        else:
+            data = make_api_call(f"{BASE_URL}/permissions/batch", method="POST",
+                                 payload={"changes": bulk_changes, "max_concurrency": int(bulk_concurrency)})
+            if data and "results" in data:
+                invalidate_cached_reads()
+                if data["failed"]:
+                    st.warning(f"{data['failed']} of {len(bulk_changes)} change(s) failed.")
+                else:
+                    st.success(f"Applied {len(bulk_changes)} change(s) across {data['securables']} securable(s).")
+                st.dataframe([{**bulk_changes[r["index"]], **r} for r in data["results"]])
+            # Error handling is done within make_api_call
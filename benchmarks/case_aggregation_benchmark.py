@@ -0,0 +1,113 @@
+"""
+Compares the old Woodcorp_O2C_Case_table build (table-materialized staging, then a
+count(distinct) subquery joined back onto every case) with the single-pass aggregation
+over ephemeral staging, exactly and with approx_count_distinct.
+
+    python benchmarks/case_aggregation_benchmark.py --scale 1000 --output case_aggregation.json
+
+Both O2C seeds are replicated `--scale` times with shifted case keys.
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import duckdb
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SEEDS = REPO_ROOT / "azure-setup" / "dbt-project" / "seeds"
+
+RAW_TABLES = """
+    create or replace table raw_activities as
+    select CASE_KEY::bigint + copy * 100000000 as CASE_KEY, ACTIVITY_EN, EVENTTIME::timestamp as EVENTTIME, SORTING
+    from read_csv('{seeds}/raw_Woodcorp_O2C_Activity_table.csv', header = true), range({scale}) as r(copy);
+
+    create or replace table raw_cases as
+    select * replace (CASE_KEY::bigint + copy * 100000000 as CASE_KEY)
+    from read_csv('{seeds}/raw_Woodcorp_O2C_Case_table.csv', header = true, all_varchar = true), range({scale}) as r(copy);
+"""
+
+STAGING_ACTIVITIES = """
+    select CASE_KEY as case_key, ACTIVITY_EN as activity_name, EVENTTIME as time_of_event, SORTING as sort_value
+    from raw_activities
+"""
+
+# Previous model: staging written as tables, distinct count in its own pass, joined back
+BASELINE = [
+    f"create or replace table stg_activities as {STAGING_ACTIVITIES}",
+    "create or replace table stg_cases as select * from raw_cases",
+    """
+    create or replace table case_table as
+    with Activity_counts as (
+        select Case_key, count(distinct activity_name) as activity_count
+        from stg_activities
+        group by 1
+    )
+    select c.*, a.activity_count as activity_count from stg_cases c
+    left join Activity_counts a on a.case_key = c.CASE_KEY
+    """,
+]
+
+SINGLE_PASS = """
+    create or replace table case_table as
+    with cases as (select * from raw_cases),
+    activities as ({staging}),
+    case_activity_stats as (
+        select
+            case_key,
+            {distinct_count} as activity_count,
+            count(*) as event_count,
+            min(time_of_event) as first_event_time,
+            max(time_of_event) as last_event_time,
+            date_diff('second', min(time_of_event), max(time_of_event)) as throughput_time_seconds
+        from activities
+        group by case_key
+    )
+    select c.*, a.activity_count, a.event_count, a.first_event_time, a.last_event_time, a.throughput_time_seconds
+    from cases c
+    left join case_activity_stats a on a.case_key = c.CASE_KEY
+"""
+
+VARIANTS = {
+    "baseline_table_staging_distinct_join": BASELINE,
+    "single_pass_ephemeral_staging": [SINGLE_PASS.format(staging=STAGING_ACTIVITIES, distinct_count="count(distinct activity_name)")],
+    "single_pass_ephemeral_staging_approx": [SINGLE_PASS.format(staging=STAGING_ACTIVITIES, distinct_count="approx_count_distinct(activity_name)")],
+}
+
+
+def run_variant(con, statements, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for statement in statements:
+            con.execute(statement)
+        timings.append(time.perf_counter() - started)
+    return {"median_seconds": round(statistics.median(timings), 3), "min_seconds": round(min(timings), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=1000, help="How many times to replicate the seeds")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--database", default=":memory:", help="DuckDB file; use a path so staging tables hit disk")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    con = duckdb.connect(args.database)
+    con.execute(RAW_TABLES.format(seeds=SEEDS, scale=args.scale))
+    report = {
+        "scale": args.scale,
+        "activity_rows": con.sql("select count(*) from raw_activities").fetchone()[0],
+        "case_rows": con.sql("select count(*) from raw_cases").fetchone()[0],
+        "variants": {name: run_variant(con, statements, args.repeats) for name, statements in VARIANTS.items()},
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output)
+
+
+if __name__ == "__main__":
+    main()
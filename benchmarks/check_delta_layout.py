@@ -0,0 +1,146 @@
+"""
+Checks that the unity plugin writes Woodcorp_O2C_Activity_table with the layout its dbt config
+asks for. partition_by, target_file_size and row_group_size are passed to the dbt-duckdb-uc
+plugin as model config, and dbt doesn't check that the plugin uses them, so this builds the model
+with dbt and inspects the Delta table it wrote:
+
+- the table's partition columns match partition_by, and every file sits in an event_month=YYYY-MM
+  directory holding only events of that month
+- every add action in _delta_log carries stats (numRecords and min/max of time_of_event), which
+  readers need to skip files
+- no data file is far above target_file_size and no Parquet row group exceeds row_group_size
+
+    # Unity Catalog from docker-setup running on localhost:8080
+    python benchmarks/check_delta_layout.py --scale 100
+
+Needs the same dbt, plugin and Unity Catalog server as run_dbt_benchmark.py. `--table-path`
+checks an already written table instead, against the given --partition-by/--target-file-size/
+--row-group-size. Exits with 1 and lists the failed checks if the layout doesn't match.
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from deltalake import DeltaTable
+
+import generate_o2c_data
+import run_dbt_benchmark
+
+MODEL = "Woodcorp_O2C_Activity_table"
+RAW_TABLE = "raw_Woodcorp_O2C_Activity_table"
+TIME_COLUMN = "time_of_event"
+# deltalake rolls files over once they reach the target, so allow some overshoot
+FILE_SIZE_TOLERANCE = 2.0
+
+
+def find_table(storage_path, model):
+    """The Delta table directory the plugin wrote for `model` under STORAGE_PATH."""
+    tables = [log_dir.parent for log_dir in Path(storage_path).rglob("_delta_log")
+              if log_dir.parent.name.lower() == model.lower()]
+    if len(tables) != 1:
+        raise SystemExit(f"Expected one Delta table named {model} under {storage_path}, found {tables}")
+    return tables[0]
+
+
+def model_config(manifest_path, model):
+    """partition_by, target_file_size and row_group_size of `model` as dbt resolved them."""
+    nodes = json.loads(Path(manifest_path).read_text())["nodes"]
+    config = next(node["config"] for node in nodes.values() if node["resource_type"] == "model" and node["name"] == model)
+    return {key: config.get(key) for key in ("partition_by", "target_file_size", "row_group_size")}
+
+
+def check_layout(table_path, partition_by, target_file_size, row_group_size):
+    """Returns (stats, failures) for the Delta table at `table_path`."""
+    dt = DeltaTable(str(table_path))
+    actions = pa.table(dt.get_add_actions(flatten=True)).to_pylist()
+    failures = []
+
+    partition_columns = dt.metadata().partition_columns
+    if partition_columns != list(partition_by or []):
+        failures.append(f"partition columns are {partition_columns}, the model config asks for {partition_by}")
+    for column in partition_columns:
+        # Any directory level, so the check also holds for the later columns of a multi-column partition_by
+        misplaced = [a["path"] for a in actions
+                     if not any(segment.startswith(f"{column}=") for segment in a["path"].split("/")[:-1])]
+        if misplaced:
+            failures.append(f"{len(misplaced)} file(s) outside a {column}=... directory, e.g. {misplaced[0]}")
+
+    no_stats = [a["path"] for a in actions if a.get("num_records") is None
+                or a.get(f"min.{TIME_COLUMN}") is None or a.get(f"max.{TIME_COLUMN}") is None]
+    if no_stats:
+        failures.append(f"{len(no_stats)} add action(s) without numRecords/min/max {TIME_COLUMN} stats, "
+                        f"e.g. {no_stats[0]}")
+    if "event_month" in partition_columns:
+        mixed = [a["path"] for a in actions if a.get(f"min.{TIME_COLUMN}") and a.get(f"max.{TIME_COLUMN}")
+                 and {a[f"min.{TIME_COLUMN}"].strftime("%Y-%m"), a[f"max.{TIME_COLUMN}"].strftime("%Y-%m")}
+                 != {a["partition.event_month"]}]
+        if mixed:
+            failures.append(f"{len(mixed)} file(s) hold events outside their event_month partition, e.g. {mixed[0]}")
+
+    largest_file = max((a["size_bytes"] for a in actions), default=0)
+    if target_file_size and largest_file > target_file_size * FILE_SIZE_TOLERANCE:
+        failures.append(f"largest data file is {largest_file} bytes, target_file_size is {target_file_size}")
+
+    largest_row_group = 0
+    for uri in dt.file_uris():
+        metadata = pq.ParquetFile(uri.removeprefix("file://")).metadata
+        largest_row_group = max([largest_row_group] + [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+    if row_group_size and largest_row_group > row_group_size:
+        failures.append(f"largest row group has {largest_row_group} rows, row_group_size is {row_group_size}")
+
+    stats = {"table": str(table_path), "version": dt.version(), "files": len(actions),
+             "rows": sum(a["num_records"] or 0 for a in actions), "partition_columns": partition_columns,
+             "partitions": len({a.get("partition.event_month") for a in actions}),
+             "largest_file_bytes": largest_file, "largest_row_group_rows": largest_row_group}
+    return stats, failures
+
+
+def build_model(scale, project_dir, workdir):
+    """Generates the raw activity data and runs the model and its upstream models with dbt."""
+    data_dir, storage_path, target_path = workdir / "raw", workdir / "storage", workdir / "target"
+    storage_path.mkdir(parents=True)
+    generate_o2c_data.generate_table(duckdb.connect(), RAW_TABLE, generate_o2c_data.DEFAULT_SEEDS, data_dir,
+                                     scale, 2_000_000, "parquet")
+    run = run_dbt_benchmark.run_dbt("build_model", ["run", "--select", f"+{MODEL}"], project_dir,
+                                    {"raw_data_path": str(data_dir), "raw_data_format": "parquet"},
+                                    storage_path, target_path)
+    if run["exit_code"] != 0:
+        raise SystemExit(f"dbt run failed with exit code {run['exit_code']}")
+    return find_table(storage_path, MODEL), model_config(target_path / "manifest.json", MODEL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=100, help="Copies of the activity seed to build the model from")
+    parser.add_argument("--project-dir", type=Path, default=run_dbt_benchmark.DEFAULT_PROJECT_DIR)
+    parser.add_argument("--table-path", type=Path, help="Check this Delta table instead of building the model")
+    parser.add_argument("--partition-by", nargs="*", default=["event_month"])
+    parser.add_argument("--target-file-size", type=int, default=134217728)
+    parser.add_argument("--row-group-size", type=int, default=131072)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="delta_layout_"))
+    try:
+        if args.table_path:
+            table_path = args.table_path
+            config = {"partition_by": args.partition_by, "target_file_size": args.target_file_size,
+                      "row_group_size": args.row_group_size}
+        else:
+            table_path, config = build_model(args.scale, args.project_dir, workdir)
+        stats, failures = check_layout(table_path, **config)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({"config": config, "table": stats, "failures": failures}, indent=2, default=str))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
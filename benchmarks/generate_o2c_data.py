@@ -0,0 +1,148 @@
+"""
+Generates scaled raw_Woodcorp_O2C_* and jaffle (raw_customers/orders/payments) datasets from
+the dbt project's seeds, streamed to Parquet part files so memory stays flat at any scale.
+
+    python benchmarks/generate_o2c_data.py --scale 100 --output-dir /tmp/o2c_100x
+
+Each of the `--scale` copies of a seed gets shifted keys, and its dates and quantities are
+jittered per case/order (deterministically, via hash), so distributions and per-case event
+sequences match the seed while keys stay unique. `--format csv` writes a single CSV per table
+instead (<output-dir>/<table>/<table>.csv), for the csv landing path and comparisons against
+`dbt seed`.
+
+`--first-copy` and `--shift-days` generate a later slice of the same data: new keys, with every
+date moved forward, e.g. new events to append before an incremental dbt run.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import duckdb
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SEEDS = REPO_ROOT / "azure-setup" / "dbt-project" / "seeds"
+
+# Keys of copy N are offset by N * KEY_OFFSET; larger than any key in the seeds
+KEY_OFFSET = 1_000_000_000
+
+# Dates are jittered by up to this many days either way
+JITTER_DAYS = 180
+
+# Per-table SELECT over `seed` and `copies(copy)`; jitter is deterministic per copy and key,
+# {shift} moves every date of a later slice forward
+TABLES = {
+    "raw_Woodcorp_O2C_Activity_table": """
+        select
+            CASE_KEY + copy * {offset} as CASE_KEY,
+            ACTIVITY_EN,
+            EVENTTIME + to_days((hash(copy, CASE_KEY) % 361)::int - 180 + {shift}) as EVENTTIME,
+            SORTING
+        from seed, copies
+    """,
+    "raw_Woodcorp_O2C_Case_table": """
+        select * exclude (copy) replace (
+            CASE_KEY + copy * {offset} as CASE_KEY,
+            greatest(1, round(ORDERED_QUANTITY * (0.5 + (hash(copy, CASE_KEY) % 100) / 100.0)))::bigint as ORDERED_QUANTITY,
+            DELIVERED_DATE + to_days((hash(copy, CASE_KEY) % 361)::int - 180 + {shift}) as DELIVERED_DATE,
+            PROMISED_DATE + to_days((hash(copy, CASE_KEY) % 361)::int - 180 + {shift}) as PROMISED_DATE
+        )
+        from seed, copies
+    """,
+    "raw_customers": """
+        select id + copy * {offset} as id, first_name, last_name
+        from seed, copies
+    """,
+    "raw_orders": """
+        select
+            id + copy * {offset} as id,
+            user_id + copy * {offset} as user_id,
+            order_date + to_days((hash(copy, id) % 361)::int - 180 + {shift}) as order_date,
+            status
+        from seed, copies
+    """,
+    "raw_payments": """
+        select
+            id + copy * {offset} as id,
+            order_id + copy * {offset} as order_id,
+            payment_method,
+            amount
+        from seed, copies
+    """,
+}
+
+
+def slice_shift_days(con, seeds_dir):
+    """Days to move a later slice forward so all its events come after every event of copies 0..N."""
+    first, last = con.sql(f"select min(EVENTTIME), max(EVENTTIME) from "
+                          f"read_csv('{seeds_dir / 'raw_Woodcorp_O2C_Activity_table'}.csv', header = true)").fetchone()
+    return (last - first).days + 2 * JITTER_DAYS + 1
+
+
+def generate_table(con, name, seeds_dir, output_dir, scale, rows_per_file, output_format, first_copy=0, shift_days=0):
+    """Writes copies first_copy..first_copy+scale of a seed; a later slice (first_copy > 0) gets its own file names."""
+    started = time.perf_counter()
+    con.execute(f"create or replace temp table seed as select * from read_csv('{seeds_dir / name}.csv', header = true)")
+    seed_rows = con.sql("select count(*) from seed").fetchone()[0]
+    select = TABLES[name].format(offset=KEY_OFFSET, shift=shift_days)
+    prefix = f"slice-{first_copy:06d}-" if first_copy else ""
+    end_copy = first_copy + scale
+
+    table_dir = output_dir / name
+    table_dir.mkdir(parents=True, exist_ok=True)
+    if output_format == "csv":
+        con.execute(f"create or replace temp view copies as select range as copy from range({first_copy}, {end_copy})")
+        target = table_dir / f"{prefix}{name}.csv"
+        con.execute(f"copy ({select}) to '{target}' (format csv, header true)")
+        files = [target]
+    else:
+        # One Parquet part file per chunk of copies, so no single query holds the whole table
+        copies_per_file = max(1, rows_per_file // max(seed_rows, 1))
+        files = []
+        for part, part_first_copy in enumerate(range(first_copy, end_copy, copies_per_file)):
+            last_copy = min(end_copy, part_first_copy + copies_per_file)
+            con.execute(f"create or replace temp view copies as select range as copy from range({part_first_copy}, {last_copy})")
+            target = table_dir / f"{prefix}part-{part:05d}.parquet"
+            con.execute(f"copy ({select}) to '{target}' (format parquet, compression zstd)")
+            files.append(target)
+
+    return {
+        "rows": seed_rows * scale,
+        "files": len(files),
+        "bytes": sum(f.stat().st_size for f in files),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=1, help="Copies of each seed, e.g. 1, 100 or 10000")
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--seeds-dir", type=Path, default=DEFAULT_SEEDS)
+    parser.add_argument("--tables", nargs="+", default=list(TABLES), choices=list(TABLES))
+    parser.add_argument("--rows-per-file", type=int, default=2_000_000, help="Approximate rows per Parquet part file")
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet")
+    parser.add_argument("--first-copy", type=int, default=0, help="Start at this copy, for a slice after copies 0..N-1")
+    parser.add_argument("--shift-days", type=int, help="Move the slice's dates forward (default with --first-copy: "
+                                                       "past every date of the earlier copies)")
+    args = parser.parse_args()
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect()
+    shift_days = args.shift_days
+    if shift_days is None:
+        shift_days = slice_shift_days(con, args.seeds_dir) if args.first_copy else 0
+    summary = {"scale": args.scale, "format": args.format, "first_copy": args.first_copy, "shift_days": shift_days,
+               "tables": {}}
+    for name in args.tables:
+        summary["tables"][name] = generate_table(
+            con, name, args.seeds_dir, args.output_dir, args.scale, args.rows_per_file, args.format,
+            args.first_copy, shift_days)
+        print(f"{name}: {summary['tables'][name]}")
+
+    generation_file = f"_generation-{args.first_copy:06d}.json" if args.first_copy else "_generation.json"
+    (args.output_dir / generation_file).write_text(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
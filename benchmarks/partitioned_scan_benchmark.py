@@ -0,0 +1,134 @@
+"""
+Compares selective DuckDB queries on Woodcorp_O2C_Activity_table written as a single
+unpartitioned Delta file (the current unity plugin layout) against a Delta table
+partitioned by event month with a target file size and row-group size.
+
+    python benchmarks/partitioned_scan_benchmark.py --scale 100 --output partitioned_scan.json
+
+The activity seed is replicated `--scale` times (with shifted case keys and event times)
+so each monthly partition holds a realistic amount of data to skip.
+"""
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+from deltalake import DeltaTable, WriterProperties, write_deltalake
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SEED = REPO_ROOT / "azure-setup" / "dbt-project" / "seeds" / "raw_Woodcorp_O2C_Activity_table.csv"
+
+QUERIES = {
+    "one_month_count": "select count(*) from activities where event_month = '{month}'",
+    "time_range_by_activity": """
+        select activity_name, count(*) from activities
+        where time_of_event >= timestamp '{month}-01' and time_of_event < timestamp '{month}-01' + interval 1 month
+        group by 1
+    """,
+    "full_scan_count": "select count(*) from activities",
+}
+
+
+def load_activities(con, seed_path, scale):
+    """Reads the seed in the staging model's shape and replicates it `scale` times."""
+    return pa.table(con.sql(f"""
+        with seed as (
+            select CASE_KEY::bigint as case_key, ACTIVITY_EN as activity_name,
+                   EVENTTIME::timestamp as time_of_event, SORTING as sort_value
+            from read_csv('{seed_path}', header = true)
+        ),
+        replicated as (
+            select case_key + copy * 100000000 as case_key, activity_name,
+                   time_of_event + to_minutes(copy::int) as time_of_event, sort_value
+            from seed, range({scale}) as r(copy)
+        )
+        select *, strftime(time_of_event, '%Y-%m') as event_month
+        from replicated
+        order by time_of_event
+    """).arrow())
+
+
+def table_files(path):
+    actions = pa.table(DeltaTable(str(path)).get_add_actions(flatten=True)).to_pydict()
+    return len(actions["path"]), sum(actions["size_bytes"])
+
+
+def register(con, path, use_delta_scan):
+    con.execute("drop view if exists activities")
+    if use_delta_scan:
+        con.execute(f"create view activities as select * from delta_scan('{path}')")
+    else:
+        # deltalake's dataset carries partition values and file statistics, so DuckDB can still skip files
+        con.register("activities_dataset", DeltaTable(str(path)).to_pyarrow_dataset())
+        con.execute("create view activities as select * from activities_dataset")
+
+
+def time_query(con, sql, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        con.sql(sql).fetchall()
+        timings.append(time.perf_counter() - started)
+    return {"median_ms": round(statistics.median(timings) * 1000, 2), "min_ms": round(min(timings) * 1000, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=Path, default=DEFAULT_SEED)
+    parser.add_argument("--scale", type=int, default=100, help="How many times to replicate the seed")
+    parser.add_argument("--target-file-size", type=int, default=32 * 1024 * 1024, help="Bytes per Delta file")
+    parser.add_argument("--row-group-size", type=int, default=128 * 1024, help="Rows per Parquet row group")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    con = duckdb.connect()
+    try:
+        con.load_extension("delta")
+        use_delta_scan = True
+    except duckdb.Error:
+        use_delta_scan = False
+
+    data = load_activities(con, args.seed, args.scale)
+    month = data["event_month"][len(data) // 2].as_py()
+    workdir = Path(tempfile.mkdtemp(prefix="partitioned_scan_"))
+    layouts = {
+        "single_file": {},
+        "partitioned_by_event_month": {
+            "partition_by": ["event_month"],
+            "target_file_size": args.target_file_size,
+            "writer_properties": WriterProperties(max_row_group_size=args.row_group_size),
+        },
+    }
+    report = {"rows": len(data), "scale": args.scale, "query_month": month,
+              "engine": "delta_scan" if use_delta_scan else "pyarrow_dataset", "layouts": {}}
+    try:
+        for name, options in layouts.items():
+            path = workdir / name
+            started = time.perf_counter()
+            write_deltalake(str(path), data, **options)
+            write_seconds = time.perf_counter() - started
+            files, size_bytes = table_files(path)
+            register(con, path, use_delta_scan)
+            report["layouts"][name] = {
+                "write_seconds": round(write_seconds, 3),
+                "files": files,
+                "bytes": size_bytes,
+                "queries": {q: time_query(con, sql.format(month=month), args.repeats) for q, sql in QUERIES.items()},
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Load test for the permissions service's Unity Catalog client: drives `/list_grants` and
+`/grant` against a stub UC HTTP server, once with the old per-request ApiClient (a new
+client, and so a new connection pool, for every call) and once with the shared pooled
+client, and reports p50/p99 latency per endpoint.
+
+    python benchmarks/permissions_service_load_test.py --requests 2000 --concurrency 32 --output load.json
+
+Needs the permissions service's dependencies (azure-setup/permissions-manager-app/requirements.txt)
+and httpx. The service runs in-process through its ASGI app; the grants read cache is disabled by
+default (`--grants-cache-ttl 0`) so every read reaches UC and only the client differs.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SERVICE_DIR = REPO_ROOT / "azure-setup" / "permissions-manager-app"
+
+GRANTS_RESPONSE = json.dumps({"privilege_assignments": [
+    {"principal": f"user{i}@example.com", "privileges": ["SELECT", "USE SCHEMA"]} for i in range(20)]}).encode()
+
+
+# === Stub Unity Catalog server ===
+class StubUCHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so a pooled client can reuse its connections
+
+    def setup(self):
+        super().setup()
+        with self.server.connections.get_lock():
+            self.server.connections.value += 1
+
+    def _respond(self, body):
+        time.sleep(self.server.latency_seconds)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if "/permissions/" in self.path:
+            self._respond(GRANTS_RESPONSE)
+        elif self.path.split("?")[0].endswith("/catalogs"):
+            self._respond(b'{"catalogs": []}')
+        else:
+            self.send_error(404)
+
+    def do_PATCH(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._respond(GRANTS_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubUCServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # Leaked per-request clients drop their connections when garbage collected
+
+
+def serve_stub(port, latency_seconds, connections):
+    server = StubUCServer(("127.0.0.1", port), StubUCHandler)
+    server.latency_seconds = latency_seconds
+    server.connections = connections
+    server.serve_forever()
+
+
+def start_stub_server(latency_seconds):
+    """Runs the stub in its own process so it doesn't compete with the service for the GIL."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    connections = multiprocessing.Value("i", 0)
+    process = multiprocessing.Process(target=serve_stub, args=(port, latency_seconds, connections), daemon=True)
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, port, connections
+
+
+# === Load ===
+def percentile(values, pct):
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1] if len(values) > 1 else values[0]
+
+
+def summarize(latencies):
+    return {"count": len(latencies), "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 2)}
+
+
+async def run_load(service, mode, pooled_get_api_client, requests, concurrency, write_ratio, stub_connections):
+    import httpx
+
+    if mode == "per_request":
+        # The service before the shared client: a new ApiClient per call, never closed
+        def get_api_client():
+            config = service.Configuration(host=service.UC_HOST)
+            return service.ApiClient(configuration=config, header_name="Authorization",
+                                     header_value=f"Bearer {service.get_admin_token()}")
+        service.get_api_client = get_api_client
+    else:
+        service.get_api_client = pooled_get_api_client
+
+    rng = random.Random(42)
+    paths = [("grant", f"/grant/table/dev.raw.t{rng.randrange(50)}/user{rng.randrange(20)}@example.com/SELECT")
+             if rng.random() < write_ratio else
+             ("list_grants", f"/list_grants/table/dev.raw.t{rng.randrange(50)}") for _ in range(requests)]
+    latencies = {"list_grants": [], "grant": []}
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with service.app.router.lifespan_context(service.app):
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://service") as client:
+            async def call(endpoint, path):
+                nonlocal errors
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(path)
+                    latencies[endpoint].append(time.perf_counter() - started)
+                    errors += response.status_code != 200
+
+            # Warm up imports and, for the pooled client, its connections
+            await asyncio.gather(*(call(*paths[i % len(paths)]) for i in range(concurrency)))
+            latencies = {"list_grants": [], "grant": []}
+            errors = 0
+            connections_before = stub_connections.value
+            started = time.perf_counter()
+            await asyncio.gather(*(call(endpoint, path) for endpoint, path in paths))
+            elapsed = time.perf_counter() - started
+
+    return {"seconds": round(elapsed, 3), "requests_per_second": round(requests / elapsed, 1), "errors": errors,
+            "uc_connections_opened": stub_connections.value - connections_before,
+            **{endpoint: summarize(values) for endpoint, values in latencies.items() if values}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="Share of /grant calls in the mix")
+    parser.add_argument("--uc-latency-ms", type=float, default=2.0, help="Simulated UC server time per call")
+    parser.add_argument("--pool-size", type=int, default=10, help="UC_CONNECTION_POOL_SIZE of the pooled client")
+    parser.add_argument("--grants-cache-ttl", type=float, default=0.0, help="GRANTS_CACHE_TTL_SECONDS")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    stub, stub_port, stub_connections = start_stub_server(args.uc_latency_ms / 1000)
+    token_file = Path(tempfile.mkdtemp()) / "token.txt"
+    token_file.write_text("load-test-token")
+    os.environ.update({
+        "UC_HOST": f"http://127.0.0.1:{stub_port}/api/2.1/unity-catalog",
+        "UC_TOKEN_FILE": str(token_file),
+        "UC_CONNECTION_POOL_SIZE": str(args.pool_size),
+        "UC_MAX_CONCURRENT_REQUESTS": str(args.concurrency),
+        "GRANTS_CACHE_TTL_SECONDS": str(args.grants_cache_ttl),
+        "PERMISSIONS_INDEX_REFRESH_SECONDS": "3600",
+        "QUERY_MODE": "off",
+    })
+    sys.path.insert(0, str(SERVICE_DIR))
+    import uc_service
+
+    pooled_get_api_client = uc_service.get_api_client
+    # Leaked per-request clients report unclosed sessions when they are garbage collected
+    logging.getLogger("asyncio").setLevel(logging.CRITICAL)
+
+    report = {"requests": args.requests, "concurrency": args.concurrency, "write_ratio": args.write_ratio,
+              "uc_latency_ms": args.uc_latency_ms, "pool_size": args.pool_size, "modes": {}}
+    for mode in ("per_request", "pooled"):
+        # The service logs with print; keep stdout for the report
+        with contextlib.redirect_stdout(sys.stderr):
+            report["modes"][mode] = asyncio.run(run_load(
+                uc_service, mode, pooled_get_api_client, args.requests, args.concurrency, args.write_ratio, stub_connections))
+    stub.terminate()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Runs `dbt build` on generated raw data against a local file-backed catalog and records
+wall time, peak memory and per-model execution time and bytes written to a JSON report.
+
+    # Unity Catalog from docker-setup running on localhost:8080
+    python benchmarks/run_dbt_benchmark.py --scale 100 --output benchmarks/results/100x.json
+    python benchmarks/run_dbt_benchmark.py --scale 100 --baseline benchmarks/results/100x.json
+
+Raw data is generated with generate_o2c_data.py (or reused with --data-dir/--skip-generate)
+and loaded first, in an "ingest" run, before the "full" build of the rest of the project:
+
+    --ingest files  the landing models bulk-load the files (`raw_data_path` var), default
+    --ingest seed   the generated CSVs replace the seeds of a copy of the project for `dbt seed`
+
+Delta tables are written under a temporary STORAGE_PATH unless --storage-path is given.
+--incremental-rerun then generates a later slice of new events (`--increment-scale` copies,
+with keys after the first `--scale` copies and dates after all of their events), loads it on top of
+the raw data, and runs a second build with `external_incremental: true` to compare full and
+incremental runs. The slice is written to the temporary directory; --data-dir is left unchanged.
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+
+import generate_o2c_data
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_PROJECT_DIR = REPO_ROOT / "azure-setup" / "dbt-project"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def files_snapshot(root):
+    return {path: path.stat().st_mtime_ns for path in root.rglob("*") if path.is_file()}
+
+
+def bytes_written_per_table(root, before):
+    """Bytes of new or rewritten files, keyed by the table directory (the parent of _delta_log)."""
+    written = {}
+    for path in root.rglob("*"):
+        if not path.is_file() or before.get(path) == path.stat().st_mtime_ns:
+            continue
+        table_dir = next((p for p in path.parents if (p / "_delta_log").is_dir()), None)
+        if table_dir is not None:
+            written[table_dir.name] = written.get(table_dir.name, 0) + path.stat().st_size
+    return written
+
+
+def link_raw_data(target, *sources):
+    """Per-table directories of symlinks to the raw files of every source, for reading them as one dataset."""
+    for source in sources:
+        for path in sorted(source.glob("*/*")):
+            if path.is_file():
+                (target / path.parent.name).mkdir(parents=True, exist_ok=True)
+                (target / path.parent.name / path.name).symlink_to(path.resolve())
+    return target
+
+
+def append_csv_rows(source, target):
+    """Appends the rows of a CSV, without its header, to another CSV with the same columns."""
+    with open(source) as rows, open(target, "a") as out:
+        next(rows)
+        shutil.copyfileobj(rows, out)
+
+
+def run_dbt(label, dbt_args, project_dir, dbt_vars, storage_path, target_path):
+    command = [
+        "dbt", *dbt_args,
+        "--project-dir", str(project_dir),
+        "--profiles-dir", str(project_dir),
+        "--target-path", str(target_path),
+        "--vars", json.dumps(dbt_vars),
+    ]
+    env = {
+        **os.environ,
+        "STORAGE_PATH": str(storage_path),
+        "UC_ENDPOINT": os.environ.get("UC_ENDPOINT", "http://localhost:8080"),
+        "UC_ADMIN_TOKEN": os.environ.get("UC_ADMIN_TOKEN", "not-used"),
+    }
+    before = files_snapshot(storage_path)
+    print(f"[{label}] {' '.join(command)}", file=sys.stderr)
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env)
+    # wait4 returns the resource usage of this dbt process alone
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_seconds = time.perf_counter() - started
+    exit_code = os.waitstatus_to_exitcode(status)
+
+    written = bytes_written_per_table(storage_path, before)
+    models = {}
+    run_results_path = target_path / "run_results.json"
+    if run_results_path.is_file():
+        for result in json.loads(run_results_path.read_text())["results"]:
+            name = result["unique_id"].split(".")[-1]
+            models[result["unique_id"]] = {
+                "status": result["status"],
+                "execution_time": round(result["execution_time"], 3),
+                "bytes_written": written.get(name, 0),
+            }
+    return {
+        "label": label,
+        "command": command,
+        "exit_code": exit_code,
+        "wall_seconds": round(wall_seconds, 3),
+        "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1),  # ru_maxrss is KiB on Linux
+        "bytes_written": sum(written.values()),
+        "models": models,
+    }
+
+
+def find_regressions(report, baseline, max_regression):
+    """Compares wall time and per-model execution time of matching runs against a baseline report."""
+    regressions = []
+    baseline_runs = {run["label"]: run for run in baseline.get("runs", [])}
+    for run in report["runs"]:
+        base = baseline_runs.get(run["label"])
+        if not base:
+            continue
+        pairs = [("wall_seconds", run["wall_seconds"], base["wall_seconds"])]
+        pairs += [(unique_id, model["execution_time"], base["models"][unique_id]["execution_time"])
+                  for unique_id, model in run["models"].items() if unique_id in base["models"]]
+        for metric, current, previous in pairs:
+            if previous > 0 and (current - previous) / previous > max_regression:
+                regressions.append({"run": run["label"], "metric": metric, "baseline": previous, "current": current})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--project-dir", type=Path, default=DEFAULT_PROJECT_DIR)
+    parser.add_argument("--data-dir", type=Path, help="Raw data directory (default: a temporary directory)")
+    parser.add_argument("--skip-generate", action="store_true", help="Reuse the data already in --data-dir")
+    parser.add_argument("--ingest", choices=["files", "seed"], default="files", help="How raw data is loaded")
+    parser.add_argument("--raw-format", choices=["parquet", "csv"], default="parquet",
+                        help="Generated file format for --ingest files (--ingest seed always uses csv)")
+    parser.add_argument("--storage-path", type=Path, help="STORAGE_PATH for the Delta tables (default: temporary)")
+    parser.add_argument("--vars", type=json.loads, default={}, help="Extra dbt vars as JSON")
+    parser.add_argument("--incremental-rerun", action="store_true")
+    parser.add_argument("--increment-scale", type=int, help="Copies in the slice loaded before the incremental run "
+                                                            "(default: 1%% of --scale, at least 1)")
+    parser.add_argument("--output", type=Path, help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", type=Path, help="Previous report to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+    if args.skip_generate and not (args.data_dir and args.data_dir.is_dir()):
+        parser.error("--skip-generate needs --data-dir pointing at previously generated data")
+
+    workdir = Path(tempfile.mkdtemp(prefix="dbt_benchmark_"))
+    data_dir = args.data_dir or workdir / "raw"
+    storage_path = args.storage_path or workdir / "storage"
+    storage_path.mkdir(parents=True, exist_ok=True)
+    raw_format = "csv" if args.ingest == "seed" else args.raw_format
+    try:
+        generation = increment = None
+        if not args.skip_generate:
+            data_dir.mkdir(parents=True, exist_ok=True)
+            con = duckdb.connect()
+            generation = {name: generate_o2c_data.generate_table(
+                con, name, generate_o2c_data.DEFAULT_SEEDS, data_dir, args.scale, 2_000_000, raw_format)
+                for name in generate_o2c_data.TABLES}
+
+        if args.ingest == "seed":
+            # dbt seed only reads the project's seed-paths, so seed a copy of the project
+            project_dir = workdir / "project"
+            shutil.copytree(args.project_dir, project_dir, ignore=shutil.ignore_patterns("target", "logs"))
+            for name in generate_o2c_data.TABLES:
+                shutil.copy(data_dir / name / f"{name}.csv", project_dir / "seeds" / f"{name}.csv")
+            dbt_vars = dict(args.vars)
+            ingest_args = ["seed"]
+            build_args = ["build", "--exclude", "resource_type:seed"]
+        else:
+            project_dir = args.project_dir
+            dbt_vars = {"raw_data_path": str(data_dir), "raw_data_format": raw_format, **args.vars}
+            ingest_args = ["run", "--select", "path:models/landing"]
+            build_args = ["build", "--exclude", "resource_type:seed", "path:models/landing"]
+
+        runs = [run_dbt("ingest", ingest_args, project_dir, dbt_vars, storage_path, workdir / "target_ingest")]
+        runs.append(run_dbt("full", build_args, project_dir, dbt_vars, storage_path, workdir / "target_full"))
+        if args.incremental_rerun:
+            # New events after everything the full build saw, so the incremental run has rows to merge
+            con = duckdb.connect()
+            increment_dir = workdir / "increment"
+            shift_days = generate_o2c_data.slice_shift_days(con, generate_o2c_data.DEFAULT_SEEDS)
+            increment_scale = args.increment_scale or max(1, args.scale // 100)
+            increment = {name: generate_o2c_data.generate_table(
+                con, name, generate_o2c_data.DEFAULT_SEEDS, increment_dir, increment_scale, 2_000_000, raw_format,
+                first_copy=args.scale, shift_days=shift_days) for name in generate_o2c_data.TABLES}
+            if args.ingest == "seed":
+                for name in generate_o2c_data.TABLES:
+                    for slice_file in (increment_dir / name).glob("*.csv"):
+                        append_csv_rows(slice_file, project_dir / "seeds" / f"{name}.csv")
+            else:
+                dbt_vars = {**dbt_vars, "raw_data_path": str(link_raw_data(workdir / "raw_with_increment",
+                                                                           data_dir, increment_dir))}
+            runs.append(run_dbt("ingest_increment", ingest_args, project_dir, dbt_vars, storage_path,
+                                workdir / "target_ingest_increment"))
+            runs.append(run_dbt("incremental", build_args, project_dir, {**dbt_vars, "external_incremental": True},
+                                storage_path, workdir / "target_incremental"))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "run_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "scale": args.scale,
+        "ingest": args.ingest,
+        "raw_format": raw_format,
+        "vars": args.vars,
+        "generation": generation,
+        "increment": increment,
+        "runs": runs,
+    }
+    if args.baseline:
+        report["regressions"] = find_regressions(report, json.loads(args.baseline.read_text()), args.max_regression)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(output)
+    if any(run["exit_code"] != 0 for run in runs) or report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
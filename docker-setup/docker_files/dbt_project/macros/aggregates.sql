@@ -0,0 +1,12 @@
+{#
+    Distinct count that switches to DuckDB's HyperLogLog estimate with
+    `--vars '{approx_distinct: true}'`, trading exactness for a bounded-memory single pass.
+#}
+
+{% macro distinct_count(column_name) -%}
+    {%- if var('approx_distinct', false) -%}
+        approx_count_distinct({{ column_name }})
+    {%- else -%}
+        count(distinct {{ column_name }})
+    {%- endif -%}
+{%- endmacro %}
@@ -0,0 +1,13 @@
+{{ config(
+    materialized='external_table',
+    location=var('storage_path'),
+    plugin='unity',
+    enabled=var('raw_data_path', none) is not none
+) }}
+
+select
+    CASE_KEY::bigint as CASE_KEY,
+    ACTIVITY_EN::varchar as ACTIVITY_EN,
+    EVENTTIME::timestamp as EVENTTIME,
+    SORTING::integer as SORTING
+from {{ read_raw_files('raw_Woodcorp_O2C_Activity_table') }}
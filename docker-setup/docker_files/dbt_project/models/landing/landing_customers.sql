@@ -0,0 +1,12 @@
+{{ config(
+    materialized='external_table',
+    location=var('storage_path'),
+    plugin='unity',
+    enabled=var('raw_data_path', none) is not none
+) }}
+
+select
+    id::bigint as id,
+    first_name::varchar as first_name,
+    last_name::varchar as last_name
+from {{ read_raw_files('raw_customers') }}
@@ -0,0 +1,13 @@
+{{ config(
+    materialized='external_table',
+    location=var('storage_path'),
+    plugin='unity',
+    enabled=var('raw_data_path', none) is not none
+) }}
+
+select
+    id::bigint as id,
+    user_id::bigint as user_id,
+    order_date::date as order_date,
+    status::varchar as status
+from {{ read_raw_files('raw_orders') }}
@@ -1,9 +1,15 @@
 {{ config(
     materialized='external_table',
     location=var('storage_path'),
-    plugin='unity'
+    plugin='unity',
+    mode=external_write_mode(),
+    unique_key='CASE_KEY',
+    pre_hook="{{ external_merge_guard('before', 'first_event_time') }}",
+    post_hook="{{ external_merge_guard('after', 'first_event_time') }}"
 ) }}
 
+{% set incremental = is_incremental_external(required_columns=['last_event_time']) %}
+
 with cases as (
 
     select * from {{ref('stg_Woodcorp_O2C_Case_table')}}
@@ -16,15 +22,52 @@ activities as (
 
 ),
 
-Activity_counts as  (
+{% if incremental %}
+-- Only rebuild cases that are new or received activities since the last run
+changed_cases as (
+
+    select distinct case_key as CASE_KEY from activities
+    where time_of_event >= {{ external_high_water_mark('last_event_time') }}
+    union
+    select CASE_KEY from cases
+    where CASE_KEY not in (select CASE_KEY from {{ this }})
+
+),
+
+{% endif %}
+-- Every per-case aggregate in a single pass over the activities
+case_activity_stats as (
 
-    select Case_key, count(distinct activity_name) as activity_count
+    select
+        case_key,
+        {{ distinct_count('activity_name') }} as activity_count,
+        count(*) as event_count,
+        min(time_of_event) as first_event_time,
+        max(time_of_event) as last_event_time,
+        date_diff('second', min(time_of_event), max(time_of_event)) as throughput_time_seconds
     from activities
-    group by 1
+    {% if incremental %}
+    where case_key in (select CASE_KEY from changed_cases)
+    {% endif %}
+    group by case_key
+
 ),
 
 final as (
-select c.*,a.activity_count as activity_count  from cases c
-left join Activity_counts a on a.case_key=c.CASE_KEY)
 
-select * from final
\ No newline at end of file
+    select
+        c.*,
+        a.activity_count,
+        a.event_count,
+        a.first_event_time,
+        a.last_event_time,
+        a.throughput_time_seconds
+    from cases c
+    left join case_activity_stats a on a.case_key = c.CASE_KEY
+    {% if incremental %}
+    where c.CASE_KEY in (select CASE_KEY from changed_cases)
+    {% endif %}
+
+)
+
+select * from final